@@ -1,37 +1,92 @@
 import json
 import os
-from datetime import datetime, timedelta
-import jwt
-import psycopg2
+from datetime import datetime, date, timedelta
+import time
+from decimal import Decimal
+import math
+import hmac
+from collections import OrderedDict
 import random
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import uuid
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Заголовки ответов собираются один раз при холодном старте
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+# Соединение, оборванное сервером или балансировщиком, без запроса не отличить от живого:
+# по умолчанию проверяем SELECT 1 при каждой выдаче из пула, окно в секундах задаётся явно
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', '0'))
+
+# Пул переживает тёплые вызовы handler: (соединение, время возврата в пул)
+_db_pool = []
+_db_pool_stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_ALGORITHMS = ['HS256']
+
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '1024'))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '60'))
+
+# Кэш профилей для verify_token: user_id -> ((id, email, name), момент истечения), порядок LRU
+_user_cache = OrderedDict()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+SMTP_TIMEOUT = 10
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_TIME_BUDGET = 25
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE = 30
+OUTBOX_RETRY_MAX = 600
+OUTBOX_RETENTION_HOURS = 24
+
+# Лимиты send_code: (ёмкость бакета, пополнение токенов в секунду)
+SEND_CODE_EMAIL_LIMIT = (3, 1 / 60)
+SEND_CODE_IP_LIMIT = (10, 1 / 30)
+LOCAL_BUCKETS_MAX_SIZE = 10000
+RATE_LIMIT_BUCKET_RETENTION_HOURS = 24
+
+# Локальный слой бакетов перед таблицей rate_limit_buckets: ключ -> [токены, время обновления]
+_local_buckets = OrderedDict()
+
+SWEEP_BATCH_SIZE = 1000
+SWEEP_TIME_BUDGET = 25
+SWEEP_GRACE_MINUTES = 60
+
+# SMTP-сессия живёт между тёплыми вызовами обработчика очереди
+_smtp_session = None
+
 def handler(event: dict, context) -> dict:
     '''API для авторизации пользователей по email с 6-значным кодом'''
     
     method = event.get('httpMethod', 'GET')
+    headers = event.get('headers', {})
     body = json.loads(event.get('body', '{}')) if event.get('body') else {}
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': '', 'isBase64Encoded': False}
+    
+    if method == 'POST' and is_service_request(headers):
+        if body.get('action') == 'deliver_outbox':
+            return deliver_outbox(body)
+        if body.get('action') == 'sweep_expired_codes':
+            return sweep_expired_codes(body)
+        return json_response(400, {'error': 'Unknown service action'})
     
     if method == 'POST':
         action = body.get('action')
         
         if action == 'send_code':
-            return send_verification_code(body.get('email'))
+            return send_verification_code(body.get('email'), get_client_ip(event))
         
         elif action == 'verify_code':
             return verify_code(body.get('email'), body.get('code'))
@@ -39,30 +94,151 @@ def handler(event: dict, context) -> dict:
         elif action == 'verify_token':
             return verify_token(body.get('token'))
     
+    return json_response(400, {'error': 'Invalid request'})
+
+def json_response(status_code: int, payload, headers: dict = JSON_HEADERS) -> dict:
+    '''Собирает ответ функции с JSON-телом'''
     return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid request'}),
+        'statusCode': status_code,
+        'headers': headers,
+        'body': encode_json(payload),
         'isBase64Encoded': False
     }
 
-def send_verification_code(email: str) -> dict:
+def encode_json(payload) -> str:
+    '''Кодирует тело ответа: через orjson, если он установлен, иначе стандартным json'''
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default).decode()
+    return json.dumps(payload, default=json_default)
+
+def json_default(value):
+    '''Сериализует Decimal и даты из строк БД без поэлементного преобразования'''
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def get_connection():
+    '''Берёт живое соединение из пула или открывает новое'''
+    import psycopg2
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if is_connection_alive(conn, released_at):
+            _db_pool_stats['hits'] += 1
+            return conn
+        _db_pool_stats['stale'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    
+    _db_pool_stats['misses'] += 1
+    print(f"[db-pool] new connection: hits={_db_pool_stats['hits']} misses={_db_pool_stats['misses']} stale={_db_pool_stats['stale']}")
+    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+
+def is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверяет соединение перед повторным использованием'''
+    import psycopg2
+    import psycopg2.extensions
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if time.monotonic() - released_at < DB_POOL_PING_AFTER:
+        return True
+    
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def release_connection(conn):
+    '''Возвращает соединение в пул (или закрывает, если пул заполнен)'''
+    import psycopg2
+    if conn.closed:
+        return
+    
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        return
+    
+    if len(_db_pool) < DB_POOL_MAX_SIZE:
+        _db_pool.append((conn, time.monotonic()))
+    else:
+        conn.close()
+
+def get_cached_user(user_id: int):
+    '''Возвращает профиль из кэша, если он ещё не устарел'''
+    cached = _user_cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        _user_cache.move_to_end(user_id)
+        _user_cache_stats['hits'] += 1
+        return cached[0]
+    
+    if cached:
+        del _user_cache[user_id]
+    _user_cache_stats['misses'] += 1
+    print(f"[user-cache] miss: hits={_user_cache_stats['hits']} misses={_user_cache_stats['misses']} invalidations={_user_cache_stats['invalidations']} size={len(_user_cache)}")
+    return None
+
+def cache_user(user: tuple):
+    '''Кладёт строку (id, email, name) в кэш профилей'''
+    _user_cache[user[0]] = (user, time.monotonic() + USER_CACHE_TTL)
+    _user_cache.move_to_end(user[0])
+    if len(_user_cache) > USER_CACHE_MAX_SIZE:
+        _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: int):
+    '''Сбрасывает профиль из кэша; вызывать при любом изменении строки users'''
+    if _user_cache.pop(user_id, None):
+        _user_cache_stats['invalidations'] += 1
+
+def is_service_request(headers: dict) -> bool:
+    '''Проверяет служебный ключ для запусков по расписанию и обслуживания'''
+    service_key = os.environ.get('SERVICE_API_KEY')
+    provided_key = headers.get('x-service-key') or headers.get('X-Service-Key')
+    if not service_key or not provided_key:
+        return False
+    return hmac.compare_digest(service_key, provided_key)
+
+def send_verification_code(email: str, client_ip: str = None) -> dict:
     '''Отправляет 6-значный код на email'''
     
     if not email or '@' not in email:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid email'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Invalid email'})
+    
+    buckets = [(f'send_code:email:{email.lower()}', SEND_CODE_EMAIL_LIMIT)]
+    if client_ip:
+        buckets.append((f'send_code:ip:{client_ip}', SEND_CODE_IP_LIMIT))
+    
+    # Быстрый отказ без обращения к БД, если этот экземпляр уже видел исчерпанный бакет
+    for bucket_key, limit in buckets:
+        retry_after = take_local_token(bucket_key, limit)
+        if retry_after:
+            return too_many_requests(retry_after)
     
     code = ''.join([str(random.randint(0, 9)) for _ in range(6)])
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
+    for bucket_key, limit in buckets:
+        retry_after = take_db_token(cur, schema, bucket_key, limit)
+        if retry_after:
+            # Списанные токены остальных бакетов сохраняем: попытка всё равно была
+            conn.commit()
+            cur.close()
+            release_connection(conn)
+            return too_many_requests(retry_after)
+    
     expires_at = datetime.utcnow() + timedelta(minutes=10)
     
     cur.execute(f'''
@@ -72,47 +248,98 @@ def send_verification_code(email: str) -> dict:
         SET code = EXCLUDED.code, expires_at = EXCLUDED.expires_at, created_at = CURRENT_TIMESTAMP
     ''', (email.lower(), code, expires_at))
     
-    conn.commit()
-    cur.close()
-    conn.close()
-    
     smtp_host = os.environ.get('SMTP_HOST')
     dev_mode = not smtp_host
     
     if not dev_mode:
-        try:
-            send_email(email, code)
-            message = 'Code sent to email'
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'Failed to send email: {str(e)}'}),
-                'isBase64Encoded': False
-            }
+        # Письмо уходит в очередь в той же транзакции, что и код; отправляет deliver_outbox
+        subject, html = build_code_email(code)
+        cur.execute(f'''
+            INSERT INTO {schema}.email_outbox (to_email, subject, html, expires_at)
+            VALUES (%s, %s, %s, %s)
+        ''', (email, subject, html, expires_at))
+        message = 'Code sent to email'
     else:
         message = f'DEV MODE: Your code is {code}'
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True, 'message': message, 'dev_code': code if dev_mode else None}),
-        'isBase64Encoded': False
-    }
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {'success': True, 'message': message, 'dev_code': code if dev_mode else None})
+
+def get_client_ip(event: dict):
+    '''Определяет IP клиента из контекста запроса или последнего звена X-Forwarded-For'''
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    
+    # Начало цепочки X-Forwarded-For присылает сам клиент и может подставить любой адрес;
+    # доверяем только звену, дописанному нашим прокси. Без него IP-бакет не применяется
+    headers = event.get('headers') or {}
+    forwarded = headers.get('x-forwarded-for') or headers.get('X-Forwarded-For')
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-1]
+    return None
+
+def take_local_token(bucket_key: str, limit: tuple) -> int:
+    '''Списывает токен из локального бакета; возвращает Retry-After в секундах или 0'''
+    capacity, refill_rate = limit
+    now = time.monotonic()
+    
+    tokens, updated_at = _local_buckets.get(bucket_key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+    
+    if tokens < 1:
+        _local_buckets[bucket_key] = (tokens, now)
+        _local_buckets.move_to_end(bucket_key)
+        return math.ceil((1 - tokens) / refill_rate)
+    
+    _local_buckets[bucket_key] = (tokens - 1, now)
+    _local_buckets.move_to_end(bucket_key)
+    if len(_local_buckets) > LOCAL_BUCKETS_MAX_SIZE:
+        _local_buckets.popitem(last=False)
+    return 0
 
-def send_email(to_email: str, code: str):
-    '''Отправляет email с кодом'''
+def take_db_token(cur, schema: str, bucket_key: str, limit: tuple) -> int:
+    '''Атомарно списывает токен из общего бакета в Postgres; возвращает Retry-After в секундах или 0'''
+    capacity, refill_rate = limit
     
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
+    cur.execute(f'''
+        INSERT INTO {schema}.rate_limit_buckets AS b (bucket_key, tokens, updated_at)
+        VALUES (%(key)s, %(capacity)s - 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (bucket_key) DO UPDATE
+        SET tokens = LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - b.updated_at) * %(rate)s) - 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - b.updated_at) * %(rate)s) >= 1
+        RETURNING tokens
+    ''', {'key': bucket_key, 'capacity': capacity, 'rate': refill_rate})
+    
+    if cur.fetchone():
+        return 0
     
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = f'Ваш код доступа: {code}'
-    msg['From'] = smtp_user
-    msg['To'] = to_email
+    cur.execute(f'''
+        SELECT LEAST(%(capacity)s, tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - updated_at) * %(rate)s)
+        FROM {schema}.rate_limit_buckets
+        WHERE bucket_key = %(key)s
+    ''', {'key': bucket_key, 'capacity': capacity, 'rate': refill_rate})
+    available = cur.fetchone()[0]
+    return max(1, math.ceil((1 - available) / refill_rate))
+
+def too_many_requests(retry_after: int) -> dict:
+    '''Ответ 429 с заголовком Retry-After'''
+    return json_response(429, {'error': 'Too many requests', 'retryAfter': retry_after}, {
+        **JSON_HEADERS,
+        'Access-Control-Expose-Headers': 'Retry-After',
+        'Retry-After': str(retry_after)
+    })
+
+def build_code_email(code: str) -> tuple:
+    '''Формирует тему и HTML письма с кодом'''
     
+    subject = f'Ваш код доступа: {code}'
     html = f'''
     <html>
       <body style="font-family: Arial, sans-serif; padding: 20px;">
@@ -124,26 +351,228 @@ def send_email(to_email: str, code: str):
       </body>
     </html>
     '''
+    return subject, html
+
+def get_smtp_session():
+    '''Возвращает авторизованную SMTP-сессию, переиспользуя её между тёплыми вызовами'''
+    import smtplib
+    global _smtp_session
+    
+    if _smtp_session is not None:
+        try:
+            if _smtp_session.noop()[0] == 250:
+                return _smtp_session
+        except smtplib.SMTPException:
+            pass
+        close_smtp_session()
+    
+    smtp_host = os.environ.get('SMTP_HOST')
+    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
+    smtp_user = os.environ.get('SMTP_USER')
+    smtp_password = os.environ.get('SMTP_PASSWORD')
+    
+    session = smtplib.SMTP(smtp_host, smtp_port, timeout=SMTP_TIMEOUT)
+    if os.environ.get('SMTP_STARTTLS', '1') == '1':
+        session.starttls()
+    if smtp_user and smtp_password:
+        session.login(smtp_user, smtp_password)
+    
+    _smtp_session = session
+    return session
+
+def close_smtp_session():
+    '''Закрывает SMTP-сессию, не падая на уже разорванном соединении'''
+    import smtplib
+    global _smtp_session
+    
+    if _smtp_session is None:
+        return
+    try:
+        _smtp_session.quit()
+    except (smtplib.SMTPException, OSError):
+        _smtp_session.close()
+    _smtp_session = None
+
+def deliver_outbox(body: dict) -> dict:
+    '''Отправляет письма из очереди пачками по одной SMTP-сессии, с повтором и экспоненциальной задержкой'''
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    
+    batch_size = min(max(int(body.get('batchSize', OUTBOX_BATCH_SIZE)), 1), 500)
+    time_budget = float(body.get('timeBudget', OUTBOX_TIME_BUDGET))
+    smtp_user = os.environ.get('SMTP_USER')
+    
+    started = time.monotonic()
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    # Код уже недействителен (expires_at хранится в UTC), отправлять такое письмо бессмысленно
+    cur.execute(f'''
+        UPDATE {schema}.email_outbox
+        SET status = 'expired', subject = '', html = ''
+        WHERE status = 'pending' AND expires_at < (now() AT TIME ZONE 'UTC')
+    ''')
+    expired = cur.rowcount
+    conn.commit()
+    
+    sent = 0
+    failed = 0
+    
+    while time.monotonic() - started < time_budget:
+        # SKIP LOCKED позволяет нескольким обработчикам разбирать очередь параллельно
+        cur.execute(f'''
+            SELECT id, to_email, subject, html, attempts
+            FROM {schema}.email_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ''', (batch_size,))
+        messages = cur.fetchall()
+        if not messages:
+            break
+        
+        for message_id, to_email, subject, html, attempts in messages:
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = subject
+            msg['From'] = smtp_user
+            msg['To'] = to_email
+            msg.attach(MIMEText(html, 'html'))
+            
+            try:
+                try:
+                    get_smtp_session().send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # Сервер закрыл простаивающую сессию: переподключаемся один раз
+                    close_smtp_session()
+                    get_smtp_session().send_message(msg)
+            except (smtplib.SMTPException, OSError) as e:
+                attempts += 1
+                retry_delay = min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+                exhausted = attempts >= OUTBOX_MAX_ATTEMPTS
+                # Исчерпавшее попытки письмо больше не отправится — код из текста стираем сразу
+                cur.execute(f'''
+                    UPDATE {schema}.email_outbox
+                    SET attempts = %s, last_error = %s,
+                        status = CASE WHEN %s THEN 'failed' ELSE 'pending' END,
+                        subject = CASE WHEN %s THEN '' ELSE subject END,
+                        html = CASE WHEN %s THEN '' ELSE html END,
+                        next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                    WHERE id = %s
+                ''', (attempts, str(e)[:500], exhausted, exhausted, exhausted, retry_delay, message_id))
+                failed += 1
+                if isinstance(e, OSError):
+                    close_smtp_session()
+                continue
+            
+            cur.execute(f'''
+                UPDATE {schema}.email_outbox
+                SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP, last_error = NULL,
+                    subject = '', html = ''
+                WHERE id = %s
+            ''', (message_id,))
+            sent += 1
+        
+        conn.commit()
+    
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {
+        'sent': sent,
+        'failed': failed,
+        'expired': expired,
+        'elapsedSeconds': round(time.monotonic() - started, 3)
+    })
+
+def sweep_expired_codes(body: dict) -> dict:
+    '''Удаляет истёкшие коды подтверждения короткими пачками, чтобы не держать долгих блокировок'''
+    
+    batch_size = min(max(int(body.get('batchSize', SWEEP_BATCH_SIZE)), 1), 10000)
+    time_budget = float(body.get('timeBudget', SWEEP_TIME_BUDGET))
+    grace_minutes = max(int(body.get('graceMinutes', SWEEP_GRACE_MINUTES)), 0)
+    
+    started = time.monotonic()
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    deleted = 0
+    batches = 0
+    slowest_batch = 0.0
+    
+    while time.monotonic() - started < time_budget:
+        batch_started = time.monotonic()
+        
+        # Пока не прошла пауза grace, verify_code ещё отвечает «Code expired», а не «Code not found»;
+        # строки, занятые параллельной отправкой или проверкой кода, пропускаем
+        cur.execute(f'''
+            DELETE FROM {schema}.verification_codes
+            WHERE email IN (
+                SELECT email FROM {schema}.verification_codes
+                WHERE expires_at < (now() AT TIME ZONE 'UTC') - make_interval(mins => %s)
+                ORDER BY expires_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+        ''', (grace_minutes, batch_size))
+        batch_deleted = cur.rowcount
+        conn.commit()
+        
+        batches += 1
+        deleted += batch_deleted
+        slowest_batch = max(slowest_batch, time.monotonic() - batch_started)
+        
+        if batch_deleted < batch_size:
+            break
+    
+    # Бакеты, простоявшие сутки, давно полные — их можно удалить без потери состояния
+    cur.execute(f'''
+        DELETE FROM {schema}.rate_limit_buckets
+        WHERE updated_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+    ''', (RATE_LIMIT_BUCKET_RETENTION_HOURS,))
+    buckets_deleted = cur.rowcount
+    conn.commit()
     
-    msg.attach(MIMEText(html, 'html'))
+    # Отработанные письма хранятся только для разбора инцидентов; текст с кодом очищен ещё при смене статуса
+    cur.execute(f'''
+        DELETE FROM {schema}.email_outbox
+        WHERE status <> 'pending' AND created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+    ''', (OUTBOX_RETENTION_HOURS,))
+    outbox_deleted = cur.rowcount
+    conn.commit()
+    
+    cur.execute(f'''
+        SELECT COUNT(*) FROM {schema}.verification_codes
+    ''')
+    remaining = cur.fetchone()[0]
     
-    with smtplib.SMTP(smtp_host, smtp_port) as server:
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
+    cur.close()
+    release_connection(conn)
+    
+    elapsed = time.monotonic() - started
+    print(f'[sweep] verification_codes: deleted={deleted} batches={batches} remaining={remaining} elapsed={elapsed:.3f}s')
+    
+    return json_response(200, {
+        'deleted': deleted,
+        'batches': batches,
+        'remaining': remaining,
+        'rateLimitBucketsDeleted': buckets_deleted,
+        'outboxDeleted': outbox_deleted,
+        'slowestBatchMs': round(slowest_batch * 1000, 1),
+        'elapsedSeconds': round(elapsed, 3)
+    })
 
 def verify_code(email: str, code: str) -> dict:
     '''Проверяет код и возвращает JWT токен'''
+    import jwt
     
     if not email or not code:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Email and code required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Email and code required'})
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
@@ -156,35 +585,20 @@ def verify_code(email: str, code: str) -> dict:
     
     if not result:
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Code not found'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return json_response(404, {'error': 'Code not found'})
     
     stored_code, expires_at = result
     
     if datetime.utcnow() > expires_at:
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Code expired'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return json_response(401, {'error': 'Code expired'})
     
     if str(stored_code).strip() != str(code).strip():
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid code'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return json_response(401, {'error': 'Invalid code'})
     
     # Проверяем, существует ли пользователь
     cur.execute(f'''
@@ -202,6 +616,7 @@ def verify_code(email: str, code: str) -> dict:
             RETURNING id, email, name
         ''', (unique_id, email.lower(), email.split('@')[0]))
         user = cur.fetchone()
+        invalidate_user(user[0])
     
     cur.execute(f'''
         DELETE FROM {schema}.verification_codes WHERE email = %s
@@ -209,88 +624,61 @@ def verify_code(email: str, code: str) -> dict:
     
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    jwt_secret = os.environ.get('JWT_SECRET')
     token = jwt.encode({
         'user_id': user[0],
         'email': user[1],
         'exp': datetime.utcnow() + timedelta(days=30)
-    }, jwt_secret, algorithm='HS256')
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({
-            'token': token,
-            'user': {
-                'id': user[0],
-                'email': user[1],
-                'name': user[2]
-            }
-        }),
-        'isBase64Encoded': False
-    }
+    }, JWT_SECRET, algorithm='HS256')
+    
+    return json_response(200, {
+        'token': token,
+        'user': {
+            'id': user[0],
+            'email': user[1],
+            'name': user[2]
+        }
+    })
 
 def verify_token(token: str) -> dict:
     '''Проверяет JWT токен и возвращает информацию о пользователе'''
+    import jwt
     
     if not token:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Token required'}),
-            'isBase64Encoded': False
-        }
-    
-    jwt_secret = os.environ.get('JWT_SECRET')
+        return json_response(400, {'error': 'Token required'})
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
         
-        conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
-        cur = conn.cursor()
-        schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-        
-        cur.execute(f'''
-            SELECT id, email, name FROM {schema}.users WHERE id = %s
-        ''', (payload['user_id'],))
-        
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
+        user = get_cached_user(payload['user_id'])
+        if not user:
+            conn = get_connection()
+            cur = conn.cursor()
+            schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+            
+            cur.execute(f'''
+                SELECT id, email, name FROM {schema}.users WHERE id = %s
+            ''', (payload['user_id'],))
+            
+            user = cur.fetchone()
+            cur.close()
+            release_connection(conn)
+            
+            if user:
+                cache_user(user)
         
         if not user:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            return json_response(404, {'error': 'User not found'})
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'user': {
-                    'id': user[0],
-                    'email': user[1],
-                    'name': user[2]
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'user': {
+                'id': user[0],
+                'email': user[1],
+                'name': user[2]
+            }
+        })
     except jwt.ExpiredSignatureError:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Token expired'})
     except jwt.InvalidTokenError:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(401, {'error': 'Invalid token'})
\ No newline at end of file
@@ -1,8 +1,46 @@
 import json
 import os
+import calendar
 from datetime import datetime, date
-import jwt
-import psycopg2
+import time
+from decimal import Decimal
+import hashlib
+from collections import OrderedDict
+import hmac
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Заголовки ответов собираются один раз при холодном старте
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization'
+}
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+# Соединение, оборванное сервером или балансировщиком, без запроса не отличить от живого:
+# по умолчанию проверяем SELECT 1 при каждой выдаче из пула, окно в секундах задаётся явно
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', '0'))
+
+# Пул переживает тёплые вызовы handler: (соединение, время возврата в пул)
+_db_pool = []
+_db_pool_stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_ALGORITHMS = ['HS256']
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', '1024'))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', '300'))
+
+# Кэш проверенных токенов: sha256(токен) -> (user_id, момент истечения), порядок LRU
+_token_cache = OrderedDict()
+_token_cache_stats = {'hits': 0, 'misses': 0}
+
+BATCH_CHUNK_SIZE = 200
+BATCH_TIME_BUDGET = 25
 
 def handler(event: dict, context) -> dict:
     '''API для автоматического создания расходов из фиксированных платежей'''
@@ -12,57 +50,157 @@ def handler(event: dict, context) -> dict:
     query_params = event.get('queryStringParameters') or {}
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    auth_header = headers.get('x-authorization') or headers.get('X-Authorization') or headers.get('authorization') or headers.get('Authorization')
-    if not auth_header:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Authorization required'}),
-            'isBase64Encoded': False
-        }
-    
-    token = auth_header.replace('Bearer ', '')
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': '', 'isBase64Encoded': False}
+    
+    if method == 'POST' and is_service_request(headers):
+        body = json.loads(event.get('body', '{}'))
+        if body.get('action') == 'process_all':
+            return process_all_users(body)
+        return json_response(400, {'error': 'Unknown service action'})
+    
+    token = get_bearer_token(headers)
+    if not token:
+        return json_response(401, {'error': 'Authorization required'})
+    
     user_id = verify_token(token)
     
     if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Invalid token'})
     
     if method == 'POST':
         body = json.loads(event.get('body', '{}'))
         return process_auto_expenses(user_id, body)
     
+    return json_response(400, {'error': 'Invalid request'})
+
+def get_bearer_token(headers: dict):
+    '''Достаёт токен из X-Authorization или Authorization независимо от регистра заголовка'''
+    lowered = {name.lower(): value for name, value in headers.items()}
+    auth_header = lowered.get('x-authorization') or lowered.get('authorization')
+    if not auth_header:
+        return None
+    return auth_header.replace('Bearer ', '')
+
+def json_response(status_code: int, payload, headers: dict = JSON_HEADERS) -> dict:
+    '''Собирает ответ функции с JSON-телом'''
     return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid request'}),
+        'statusCode': status_code,
+        'headers': headers,
+        'body': encode_json(payload),
         'isBase64Encoded': False
     }
 
+def encode_json(payload) -> str:
+    '''Кодирует тело ответа: через orjson, если он установлен, иначе стандартным json'''
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default).decode()
+    return json.dumps(payload, default=json_default)
+
+def json_default(value):
+    '''Сериализует Decimal и даты из строк БД без поэлементного преобразования'''
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def get_connection():
+    '''Берёт живое соединение из пула или открывает новое'''
+    import psycopg2
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if is_connection_alive(conn, released_at):
+            _db_pool_stats['hits'] += 1
+            return conn
+        _db_pool_stats['stale'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    
+    _db_pool_stats['misses'] += 1
+    print(f"[db-pool] new connection: hits={_db_pool_stats['hits']} misses={_db_pool_stats['misses']} stale={_db_pool_stats['stale']}")
+    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+
+def is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверяет соединение перед повторным использованием'''
+    import psycopg2
+    import psycopg2.extensions
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if time.monotonic() - released_at < DB_POOL_PING_AFTER:
+        return True
+    
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def release_connection(conn):
+    '''Возвращает соединение в пул (или закрывает, если пул заполнен)'''
+    import psycopg2
+    if conn.closed:
+        return
+    
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        return
+    
+    if len(_db_pool) < DB_POOL_MAX_SIZE:
+        _db_pool.append((conn, time.monotonic()))
+    else:
+        conn.close()
+
+def is_service_request(headers: dict) -> bool:
+    '''Проверяет служебный ключ для запусков по расписанию и обслуживания'''
+    service_key = os.environ.get('SERVICE_API_KEY')
+    provided_key = headers.get('x-service-key') or headers.get('X-Service-Key')
+    if not service_key or not provided_key:
+        return False
+    return hmac.compare_digest(service_key, provided_key)
+
 def verify_token(token: str):
-    '''Проверяет JWT токен и возвращает user_id'''
-    jwt_secret = os.environ.get('JWT_SECRET')
+    '''Проверяет JWT токен и возвращает user_id (проверенные токены кэшируются до exp)'''
+    import jwt
+    now = time.time()
+    cache_key = hashlib.sha256(token.encode()).digest()
+    
+    cached = _token_cache.get(cache_key)
+    if cached:
+        user_id, expires_at = cached
+        if expires_at > now:
+            _token_cache.move_to_end(cache_key)
+            _token_cache_stats['hits'] += 1
+            return user_id
+        del _token_cache[cache_key]
+    
+    _token_cache_stats['misses'] += 1
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload['user_id']
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
         return None
+    
+    user_id = payload.get('user_id')
+    if not user_id:
+        return None
+    
+    # Без exp токен всё равно перепроверяется не реже раза в TOKEN_CACHE_TTL секунд
+    expires_at = min(payload.get('exp', now + TOKEN_CACHE_TTL), now + TOKEN_CACHE_TTL)
+    _token_cache[cache_key] = (user_id, expires_at)
+    if len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+    
+    print(f"[token-cache] miss: hits={_token_cache_stats['hits']} misses={_token_cache_stats['misses']} size={len(_token_cache)}")
+    return user_id
 
 def process_auto_expenses(user_id: int, body: dict) -> dict:
     '''Создает расходы из активных фиксированных платежей для указанного месяца'''
@@ -75,96 +213,278 @@ def process_auto_expenses(user_id: int, body: dict) -> dict:
         year = current_date.year
         month = current_date.month
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        year, month = int(year), int(month)
+        calendar.monthrange(year, month)
+    except (TypeError, ValueError, calendar.IllegalMonthError):
+        return json_response(400, {'error': 'Invalid year or month'})
+    
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
-    # Получаем активные фиксированные расходы пользователя
+    created_expenses, skipped_expenses = create_auto_expenses(cur, schema, [user_id], year, month)
+    
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {
+        'created': created_expenses,
+        'skipped': skipped_expenses,
+        'total': len(created_expenses),
+        'year': year,
+        'month': month
+    })
+
+def process_all_users(body: dict) -> dict:
+    '''Пакетно создаёт автоплатежи месяца для всех пользователей с контрольной точкой'''
+    
+    current_date = datetime.now()
+    try:
+        year = int(body.get('year') or current_date.year)
+        month = int(body.get('month') or current_date.month)
+        calendar.monthrange(year, month)
+        chunk_size = min(max(int(body.get('chunkSize', BATCH_CHUNK_SIZE)), 1), 5000)
+        time_budget = float(body.get('timeBudget', BATCH_TIME_BUDGET))
+    except (TypeError, ValueError, calendar.IllegalMonthError):
+        return json_response(400, {'error': 'Invalid batch parameters'})
+    
+    started = time.monotonic()
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    if body.get('restart'):
+        # Заявки на диапазоны удаляются каскадом
+        cur.execute(f'''
+            DELETE FROM {schema}.auto_expense_runs WHERE year = %s AND month = %s
+        ''', (year, month))
+    
     cur.execute(f'''
-        SELECT id, title, amount, category, day_of_month
-        FROM {schema}.fixed_expenses
-        WHERE user_id = %s AND is_active = TRUE
-    ''', (user_id,))
+        INSERT INTO {schema}.auto_expense_runs (year, month)
+        VALUES (%s, %s)
+        ON CONFLICT (year, month) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+        RETURNING last_user_id, completed_at
+    ''', (year, month))
+    last_user_id, completed_at = cur.fetchone()
+    conn.commit()
     
-    fixed_expenses = cur.fetchall()
-    created_expenses = []
-    skipped_expenses = []
+    users_processed = 0
+    expenses_created = 0
+    done = completed_at is not None
     
-    for fixed_exp in fixed_expenses:
-        fixed_id, title, amount, category, day_of_month = fixed_exp
+    while not done and time.monotonic() - started < time_budget:
+        chunk = claim_auto_expense_chunk(cur, schema, year, month, chunk_size)
+        conn.commit()
         
-        # Проверяем, не создан ли уже расход для этого месяца
-        cur.execute(f'''
-            SELECT id FROM {schema}.auto_created_expenses
-            WHERE fixed_expense_id = %s AND year = %s AND month = %s
-        ''', (fixed_id, year, month))
+        if chunk == 'completed':
+            done = True
+            break
+        if chunk is None:
+            # Новых диапазонов нет, а незавершённые сейчас обрабатывают другие запуски
+            break
         
-        if cur.fetchone():
-            skipped_expenses.append({
-                'fixedExpenseId': fixed_id,
-                'title': title,
-                'reason': 'Already created for this month'
-            })
+        # Берём диапазон в работу под блокировкой его строки: упавший запуск
+        # оставит его незавершённым и свободным, и следующий запуск подберёт его
+        cur.execute(f'''
+            SELECT id, after_user_id, last_user_id
+            FROM {schema}.auto_expense_chunks
+            WHERE id = %s AND completed_at IS NULL
+            FOR UPDATE SKIP LOCKED
+        ''', (chunk,))
+        row = cur.fetchone()
+        if not row:
+            conn.commit()
             continue
+        chunk_id, after_user_id, last_user_id = row
         
-        # Определяем дату расхода
-        # Если день месяца уже прошел в текущем месяце, используем этот день
-        # Иначе используем текущую дату
-        current_day = datetime.now().day
-        expense_day = day_of_month if day_of_month <= current_day else current_day
+        cur.execute(f'''
+            SELECT u.id
+            FROM {schema}.users u
+            WHERE u.id > %s AND u.id <= %s AND EXISTS (
+                SELECT 1 FROM {schema}.fixed_expenses f
+                WHERE f.user_id = u.id AND f.is_active = TRUE
+            )
+            ORDER BY u.id
+        ''', (after_user_id, last_user_id))
+        user_ids = [row[0] for row in cur.fetchall()]
         
-        try:
-            expense_date = date(year, month, expense_day)
-        except ValueError:
-            # Если день невалидный для месяца (например, 31 февраля), используем последний день месяца
-            if month == 12:
-                next_month = date(year + 1, 1, 1)
-            else:
-                next_month = date(year, month + 1, 1)
-            
-            from datetime import timedelta
-            last_day = (next_month - timedelta(days=1)).day
-            expense_date = date(year, month, min(day_of_month, last_day))
+        created, _ = create_auto_expenses(cur, schema, user_ids, year, month, cap_to_today=False) if user_ids else ([], [])
         
-        # Создаем расход
+        # Отметка о завершении диапазона фиксируется в той же транзакции, что и его расходы
         cur.execute(f'''
-            INSERT INTO {schema}.expenses (user_id, amount, category, description, date)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id, amount, category, description, date
-        ''', (user_id, amount, category, f'{title} (автоплатеж)', expense_date))
+            UPDATE {schema}.auto_expense_chunks SET completed_at = CURRENT_TIMESTAMP WHERE id = %s
+        ''', (chunk_id,))
+        cur.execute(f'''
+            UPDATE {schema}.auto_expense_runs
+            SET users_processed = users_processed + %s,
+                expenses_created = expenses_created + %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE year = %s AND month = %s
+        ''', (len(user_ids), len(created), year, month))
+        conn.commit()
         
-        expense = cur.fetchone()
-        expense_id = expense[0]
+        users_processed += len(user_ids)
+        expenses_created += len(created)
+    
+    cur.close()
+    release_connection(conn)
+    
+    elapsed = time.monotonic() - started
+    
+    return json_response(200, {
+        'year': year,
+        'month': month,
+        'done': done,
+        'checkpoint': last_user_id,
+        'usersProcessed': users_processed,
+        'expensesCreated': expenses_created,
+        'elapsedSeconds': round(elapsed, 3),
+        'usersPerSecond': round(users_processed / elapsed, 1) if elapsed > 0 else None
+    })
+
+def claim_auto_expense_chunk(cur, schema: str, year: int, month: int, chunk_size: int):
+    '''Выбирает диапазон пользователей для обработки: сначала брошенный незавершённый, иначе выдаёт новый за границей.
+    Возвращает id диапазона, None если работы сейчас нет, или 'completed', если месяц обработан целиком'''
+    cur.execute(f'''
+        SELECT id FROM {schema}.auto_expense_chunks
+        WHERE year = %s AND month = %s AND completed_at IS NULL
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ''', (year, month))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    
+    # Строка запуска сериализует выдачу диапазонов между параллельными запусками
+    cur.execute(f'''
+        SELECT last_user_id FROM {schema}.auto_expense_runs
+        WHERE year = %s AND month = %s
+        FOR UPDATE
+    ''', (year, month))
+    frontier = cur.fetchone()[0]
+    
+    cur.execute(f'''
+        SELECT MAX(id) FROM (
+            SELECT u.id
+            FROM {schema}.users u
+            WHERE u.id > %s AND EXISTS (
+                SELECT 1 FROM {schema}.fixed_expenses f
+                WHERE f.user_id = u.id AND f.is_active = TRUE
+            )
+            ORDER BY u.id
+            LIMIT %s
+        ) next_users
+    ''', (frontier, chunk_size))
+    chunk_end = cur.fetchone()[0]
+    
+    if chunk_end is None:
+        # Завершён, только если за границей пусто и ни один выданный диапазон не остался недоделанным,
+        # включая те, что прямо сейчас заблокированы другими запусками
+        cur.execute(f'''
+            SELECT EXISTS (
+                SELECT 1 FROM {schema}.auto_expense_chunks
+                WHERE year = %s AND month = %s AND completed_at IS NULL
+            )
+        ''', (year, month))
+        if cur.fetchone()[0]:
+            return None
         
-        # Записываем в таблицу автосозданных расходов
         cur.execute(f'''
+            UPDATE {schema}.auto_expense_runs
+            SET completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE year = %s AND month = %s
+        ''', (year, month))
+        return 'completed'
+    
+    cur.execute(f'''
+        INSERT INTO {schema}.auto_expense_chunks (year, month, after_user_id, last_user_id)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    ''', (year, month, frontier, chunk_end))
+    chunk_id = cur.fetchone()[0]
+    
+    cur.execute(f'''
+        UPDATE {schema}.auto_expense_runs
+        SET last_user_id = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE year = %s AND month = %s
+    ''', (chunk_end, year, month))
+    return chunk_id
+
+def create_auto_expenses(cur, schema: str, user_ids: list, year: int, month: int, cap_to_today: bool = True) -> tuple:
+    '''Одним запросом создаёт расходы месяца по активным фиксированным платежам пользователей'''
+    
+    # День расхода: день платежа, но не позже последнего дня месяца. Кнопка пользователя
+    # ещё и не ставит дату позже сегодняшней; пакетный запуск закрывает месяц целиком,
+    # поэтому датирует каждый платёж его собственным днём
+    day_cap = calendar.monthrange(year, month)[1]
+    if cap_to_today:
+        day_cap = min(datetime.now().day, day_cap)
+    
+    # Сначала занимаем слот (fixed_expense_id, year, month) в auto_created_expenses:
+    # уникальный ключ отсекает повторы, в том числе от параллельных запусков.
+    # id расхода выдаётся заранее из последовательности, а внешний ключ
+    # проверяется в конце оператора, когда расход уже вставлен
+    cur.execute(f'''
+        WITH candidates AS (
+            SELECT f.id AS fixed_id, f.user_id, f.title, f.amount, f.category,
+                   make_date(%(year)s, %(month)s, LEAST(f.day_of_month, %(day_cap)s)) AS expense_date,
+                   nextval(pg_get_serial_sequence('{schema}.expenses', 'id')) AS expense_id
+            FROM {schema}.fixed_expenses f
+            WHERE f.user_id = ANY(%(user_ids)s) AND f.is_active = TRUE
+        ),
+        claimed AS (
             INSERT INTO {schema}.auto_created_expenses (user_id, fixed_expense_id, expense_id, year, month)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (user_id, fixed_id, expense_id, year, month))
+            SELECT user_id, fixed_id, expense_id, %(year)s, %(month)s
+            FROM candidates
+            ON CONFLICT (fixed_expense_id, year, month) DO NOTHING
+            RETURNING expense_id
+        ),
+        created AS (
+            INSERT INTO {schema}.expenses (id, user_id, amount, category, description, date)
+            SELECT c.expense_id, c.user_id, c.amount, c.category, c.title || ' (автоплатеж)', c.expense_date
+            FROM candidates c
+            JOIN claimed USING (expense_id)
+            RETURNING id, user_id, amount, category, description, date
+        ),
+        rolled_up AS (
+            INSERT INTO {schema}.monthly_rollups (user_id, year, month, category, kind, total_amount, tx_count)
+            SELECT user_id, %(year)s, %(month)s, category, 'expense', SUM(amount), COUNT(*)
+            FROM created
+            GROUP BY user_id, category
+            ON CONFLICT (user_id, year, month, category, kind) DO UPDATE
+            SET total_amount = monthly_rollups.total_amount + EXCLUDED.total_amount,
+                tx_count = monthly_rollups.tx_count + EXCLUDED.tx_count,
+                updated_at = CURRENT_TIMESTAMP
+        )
+        SELECT c.fixed_id, c.title, e.id, e.amount, e.category, e.description, e.date
+        FROM candidates c
+        LEFT JOIN created e ON e.id = c.expense_id
+        ORDER BY c.user_id, c.fixed_id
+    ''', {'user_ids': list(user_ids), 'year': year, 'month': month, 'day_cap': day_cap})
+    
+    created_expenses = []
+    skipped_expenses = []
+    
+    for fixed_id, title, expense_id, amount, category, description, expense_date in cur.fetchall():
+        if expense_id is None:
+            skipped_expenses.append({
+                'fixedExpenseId': fixed_id,
+                'title': title,
+                'reason': 'Already created for this month'
+            })
+            continue
         
         created_expenses.append({
-            'id': expense[0],
-            'amount': float(expense[1]),
-            'category': expense[2],
-            'description': expense[3],
-            'date': expense[4].isoformat(),
+            'id': expense_id,
+            'amount': amount,
+            'category': category,
+            'description': description,
+            'date': expense_date,
             'fixedExpenseId': fixed_id,
             'fixedExpenseTitle': title
         })
     
-    conn.commit()
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({
-            'created': created_expenses,
-            'skipped': skipped_expenses,
-            'total': len(created_expenses),
-            'year': year,
-            'month': month
-        }),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return created_expenses, skipped_expenses
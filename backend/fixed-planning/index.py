@@ -1,8 +1,65 @@
 import json
 import os
-from datetime import datetime
-import jwt
-import psycopg2
+from datetime import datetime, date, timedelta
+import time
+from decimal import Decimal
+import hashlib
+import hmac
+import base64
+import binascii
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Заголовки ответов собираются один раз при холодном старте
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, If-None-Match'
+}
+# Клиент обязан перепроверять кэш по ETag перед каждым использованием
+CACHEABLE_HEADERS = {
+    **JSON_HEADERS,
+    'Cache-Control': 'private, no-cache',
+    'Access-Control-Expose-Headers': 'ETag'
+}
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+# Соединение, оборванное сервером или балансировщиком, без запроса не отличить от живого:
+# по умолчанию проверяем SELECT 1 при каждой выдаче из пула, окно в секундах задаётся явно
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', '0'))
+
+# Пул переживает тёплые вызовы handler: (соединение, время возврата в пул)
+_db_pool = []
+_db_pool_stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_ALGORITHMS = ['HS256']
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', '1024'))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', '300'))
+
+# Кэш проверенных токенов: sha256(токен) -> (user_id, момент истечения), порядок LRU
+_token_cache = OrderedDict()
+_token_cache_stats = {'hits': 0, 'misses': 0}
+
+MAX_DRIFT_REPORT = 100
+MAX_PAGE_SIZE = 500
+MAX_GOALS_PER_REQUEST = 100
+
+FORECAST_CACHE_MAX_SIZE = int(os.environ.get('FORECAST_CACHE_MAX_SIZE', '4096'))
+# Темп по регрессии считается, только если пополнения растянуты хотя бы на столько дней
+FORECAST_MIN_SPAN_DAYS = 30
+AVG_DAYS_PER_MONTH = 30.4375
+# Дальше этого горизонта дата достижения не прогнозируется (и не выходит за date.max)
+FORECAST_MAX_YEARS = 100
+
+# Темп пополнений по целям: planning_id -> (версия истории, темп в день), порядок LRU
+_forecast_cache = OrderedDict()
+_forecast_cache_stats = {'hits': 0, 'misses': 0}
 
 def handler(event: dict, context) -> dict:
     '''API для управления фиксированными расходами и планированием'''
@@ -12,43 +69,34 @@ def handler(event: dict, context) -> dict:
     query_params = event.get('queryStringParameters') or {}
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': '', 'isBase64Encoded': False}
     
-    auth_header = headers.get('x-authorization') or headers.get('X-Authorization') or headers.get('authorization') or headers.get('Authorization')
-    if not auth_header:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Authorization required'}),
-            'isBase64Encoded': False
-        }
+    if method == 'POST' and is_service_request(headers):
+        body = json.loads(event.get('body', '{}'))
+        if body.get('action') == 'reconcile_saved_amounts':
+            return reconcile_saved_amounts(body)
+        return json_response(400, {'error': 'Unknown service action'})
+    
+    token = get_bearer_token(headers)
+    if not token:
+        return json_response(401, {'error': 'Authorization required'})
     
-    token = auth_header.replace('Bearer ', '')
     user_id = verify_token(token)
     
     if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Invalid token'})
     
     resource_type = query_params.get('type')
     
+    if method == 'GET' and resource_type == 'planning' and query_params.get('action') == 'forecast':
+        return get_forecasts(user_id)
+    
     if method == 'GET' and resource_type:
+        if 'ids' in query_params:
+            return get_deposits_for_goals(user_id, query_params)
         if 'id' in query_params and 'depositId' not in query_params:
-            return get_deposits(user_id, query_params['id'])
-        return get_items(user_id, resource_type)
+            return get_deposits(user_id, query_params)
+        return get_items(user_id, resource_type, headers)
     
     if method == 'POST':
         body = json.loads(event.get('body', '{}'))
@@ -65,30 +113,178 @@ def handler(event: dict, context) -> dict:
             return delete_deposit(user_id, query_params)
         return delete_item(user_id, query_params)
     
+    return json_response(400, {'error': 'Invalid request'})
+
+def get_bearer_token(headers: dict):
+    '''Достаёт токен из X-Authorization или Authorization независимо от регистра заголовка'''
+    lowered = {name.lower(): value for name, value in headers.items()}
+    auth_header = lowered.get('x-authorization') or lowered.get('authorization')
+    if not auth_header:
+        return None
+    return auth_header.replace('Bearer ', '')
+
+def json_response(status_code: int, payload, headers: dict = JSON_HEADERS) -> dict:
+    '''Собирает ответ функции с JSON-телом'''
     return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid request'}),
+        'statusCode': status_code,
+        'headers': headers,
+        'body': encode_json(payload),
         'isBase64Encoded': False
     }
 
+def encode_json(payload) -> str:
+    '''Кодирует тело ответа: через orjson, если он установлен, иначе стандартным json'''
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default).decode()
+    return json.dumps(payload, default=json_default)
+
+def json_default(value):
+    '''Сериализует Decimal и даты из строк БД без поэлементного преобразования'''
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def get_resource_etag(cur, schema: str, user_id: int, resource: str, query_params: dict) -> str:
+    '''Строит ETag из счётчика изменений ресурса и параметров запроса'''
+    cur.execute(f'''
+        SELECT version FROM {schema}.resource_versions
+        WHERE user_id = %s AND resource = %s
+    ''', (user_id, resource))
+    row = cur.fetchone()
+    version = row[0] if row else 0
+    
+    params_digest = hashlib.sha1(json.dumps(sorted(query_params.items())).encode()).hexdigest()[:12]
+    return f'W/"{resource}-{user_id}-{version}-{params_digest}"'
+
+def is_not_modified(request_headers: dict, etag: str) -> bool:
+    '''Сравнивает ETag с заголовком If-None-Match клиента'''
+    lowered = {name.lower(): value for name, value in (request_headers or {}).items()}
+    if_none_match = lowered.get('if-none-match')
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+def not_modified_response(etag: str) -> dict:
+    '''Ответ 304 без тела'''
+    return {'statusCode': 304, 'headers': {**CACHEABLE_HEADERS, 'ETag': etag}, 'body': '', 'isBase64Encoded': False}
+
+def get_connection():
+    '''Берёт живое соединение из пула или открывает новое'''
+    import psycopg2
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if is_connection_alive(conn, released_at):
+            _db_pool_stats['hits'] += 1
+            return conn
+        _db_pool_stats['stale'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    
+    _db_pool_stats['misses'] += 1
+    print(f"[db-pool] new connection: hits={_db_pool_stats['hits']} misses={_db_pool_stats['misses']} stale={_db_pool_stats['stale']}")
+    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+
+def is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверяет соединение перед повторным использованием'''
+    import psycopg2
+    import psycopg2.extensions
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if time.monotonic() - released_at < DB_POOL_PING_AFTER:
+        return True
+    
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def release_connection(conn):
+    '''Возвращает соединение в пул (или закрывает, если пул заполнен)'''
+    import psycopg2
+    if conn.closed:
+        return
+    
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        return
+    
+    if len(_db_pool) < DB_POOL_MAX_SIZE:
+        _db_pool.append((conn, time.monotonic()))
+    else:
+        conn.close()
+
+def is_service_request(headers: dict) -> bool:
+    '''Проверяет служебный ключ для запусков по расписанию и обслуживания'''
+    service_key = os.environ.get('SERVICE_API_KEY')
+    provided_key = headers.get('x-service-key') or headers.get('X-Service-Key')
+    if not service_key or not provided_key:
+        return False
+    return hmac.compare_digest(service_key, provided_key)
+
 def verify_token(token: str):
-    '''Проверяет JWT токен и возвращает user_id'''
-    jwt_secret = os.environ.get('JWT_SECRET')
+    '''Проверяет JWT токен и возвращает user_id (проверенные токены кэшируются до exp)'''
+    import jwt
+    now = time.time()
+    cache_key = hashlib.sha256(token.encode()).digest()
+    
+    cached = _token_cache.get(cache_key)
+    if cached:
+        user_id, expires_at = cached
+        if expires_at > now:
+            _token_cache.move_to_end(cache_key)
+            _token_cache_stats['hits'] += 1
+            return user_id
+        del _token_cache[cache_key]
+    
+    _token_cache_stats['misses'] += 1
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload['user_id']
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
         return None
+    
+    user_id = payload.get('user_id')
+    if not user_id:
+        return None
+    
+    # Без exp токен всё равно перепроверяется не реже раза в TOKEN_CACHE_TTL секунд
+    expires_at = min(payload.get('exp', now + TOKEN_CACHE_TTL), now + TOKEN_CACHE_TTL)
+    _token_cache[cache_key] = (user_id, expires_at)
+    if len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+    
+    print(f"[token-cache] miss: hits={_token_cache_stats['hits']} misses={_token_cache_stats['misses']} size={len(_token_cache)}")
+    return user_id
 
-def get_items(user_id: int, resource_type: str) -> dict:
+def get_items(user_id: int, resource_type: str, request_headers: dict) -> dict:
     '''Получает список фиксированных расходов или планов'''
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    if resource_type not in ('fixed', 'planning'):
+        return json_response(400, {'error': 'Invalid type'})
+    
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
+    # Если у клиента актуальная версия, не читаем и не сериализуем строки
+    etag = get_resource_etag(cur, schema, user_id, resource_type, {'type': resource_type})
+    if is_not_modified(request_headers, etag):
+        cur.close()
+        release_connection(conn)
+        return not_modified_response(etag)
+    
     if resource_type == 'fixed':
         cur.execute(f'''
             SELECT id, title, amount, category, day_of_month, is_active, created_at
@@ -103,11 +299,11 @@ def get_items(user_id: int, resource_type: str) -> dict:
             items.append({
                 'id': row[0],
                 'title': row[1],
-                'amount': float(row[2]),
+                'amount': row[2],
                 'category': row[3],
                 'dayOfMonth': row[4],
                 'isActive': row[5],
-                'createdAt': row[6].isoformat() if row[6] else None
+                'createdAt': row[6]
             })
     
     elif resource_type == 'planning':
@@ -124,39 +320,25 @@ def get_items(user_id: int, resource_type: str) -> dict:
             items.append({
                 'id': row[0],
                 'title': row[1],
-                'targetAmount': float(row[2]),
-                'savedAmount': float(row[3]),
-                'targetDate': row[4].isoformat() if row[4] else None,
+                'targetAmount': row[2],
+                'savedAmount': row[3],
+                'targetDate': row[4],
                 'category': row[5],
                 'isCompleted': row[6],
-                'createdAt': row[7].isoformat() if row[7] else None
+                'createdAt': row[7]
             })
-    else:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid type'}),
-            'isBase64Encoded': False
-        }
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'items': items}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {'items': items}, {**CACHEABLE_HEADERS, 'ETag': etag})
 
 def add_item(user_id: int, body: dict) -> dict:
     '''Добавляет фиксированный расход или план'''
     
     resource_type = body.get('type')
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
@@ -168,13 +350,8 @@ def add_item(user_id: int, body: dict) -> dict:
         
         if not all([title, amount, category, day_of_month]):
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Missing required fields'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return json_response(400, {'error': 'Missing required fields'})
         
         cur.execute(f'''
             INSERT INTO {schema}.fixed_expenses (user_id, title, amount, category, day_of_month)
@@ -186,11 +363,11 @@ def add_item(user_id: int, body: dict) -> dict:
         result = {
             'id': row[0],
             'title': row[1],
-            'amount': float(row[2]),
+            'amount': row[2],
             'category': row[3],
             'dayOfMonth': row[4],
             'isActive': row[5],
-            'createdAt': row[6].isoformat() if row[6] else None
+            'createdAt': row[6]
         }
     
     elif resource_type == 'planning':
@@ -201,13 +378,8 @@ def add_item(user_id: int, body: dict) -> dict:
         
         if not all([title, target_amount, category]):
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Missing required fields'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return json_response(400, {'error': 'Missing required fields'})
         
         cur.execute(f'''
             INSERT INTO {schema}.planning (user_id, title, target_amount, category, target_date)
@@ -219,33 +391,23 @@ def add_item(user_id: int, body: dict) -> dict:
         result = {
             'id': row[0],
             'title': row[1],
-            'targetAmount': float(row[2]),
-            'savedAmount': float(row[3]),
-            'targetDate': row[4].isoformat() if row[4] else None,
+            'targetAmount': row[2],
+            'savedAmount': row[3],
+            'targetDate': row[4],
             'category': row[5],
             'isCompleted': row[6],
-            'createdAt': row[7].isoformat() if row[7] else None
+            'createdAt': row[7]
         }
     else:
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid type'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return json_response(400, {'error': 'Invalid type'})
     
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 201,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'item': result}),
-        'isBase64Encoded': False
-    }
+    return json_response(201, {'item': result})
 
 def update_item(user_id: int, body: dict) -> dict:
     '''Обновляет фиксированный расход или план'''
@@ -254,14 +416,9 @@ def update_item(user_id: int, body: dict) -> dict:
     item_id = body.get('id')
     
     if not item_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Missing item id'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Missing item id'})
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
@@ -278,22 +435,17 @@ def update_item(user_id: int, body: dict) -> dict:
         row = cur.fetchone()
         if not row:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Item not found'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return json_response(404, {'error': 'Item not found'})
         
         result = {
             'id': row[0],
             'title': row[1],
-            'amount': float(row[2]),
+            'amount': row[2],
             'category': row[3],
             'dayOfMonth': row[4],
             'isActive': row[5],
-            'createdAt': row[6].isoformat() if row[6] else None
+            'createdAt': row[6]
         }
     
     elif resource_type == 'planning':
@@ -301,17 +453,19 @@ def update_item(user_id: int, body: dict) -> dict:
             amount_to_add = body['addAmount']
             comment = body.get('comment', '')
             
+            # Пополнение пишется только если цель принадлежит пользователю
             cur.execute(f'''
-                INSERT INTO {schema}.planning_deposits (planning_id, amount, comment)
-                VALUES (%s, %s, %s)
-            ''', (item_id, amount_to_add, comment))
-            
-            cur.execute(f'''
-                UPDATE {schema}.planning
-                SET saved_amount = saved_amount + %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s AND user_id = %s
-                RETURNING id, title, target_amount, saved_amount, target_date, category, is_completed, created_at
-            ''', (amount_to_add, item_id, user_id))
+                WITH goal AS (
+                    UPDATE {schema}.planning
+                    SET saved_amount = saved_amount + %(amount)s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %(id)s AND user_id = %(user_id)s
+                    RETURNING id, title, target_amount, saved_amount, target_date, category, is_completed, created_at
+                ), deposit AS (
+                    INSERT INTO {schema}.planning_deposits (planning_id, amount, comment)
+                    SELECT id, %(amount)s, %(comment)s FROM goal
+                )
+                SELECT * FROM goal
+            ''', {'amount': amount_to_add, 'comment': comment, 'id': item_id, 'user_id': user_id})
         elif 'isCompleted' in body:
             cur.execute(f'''
                 UPDATE {schema}.planning
@@ -321,141 +475,225 @@ def update_item(user_id: int, body: dict) -> dict:
             ''', (body['isCompleted'], item_id, user_id))
         else:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No fields to update'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return json_response(400, {'error': 'No fields to update'})
         
         row = cur.fetchone()
         if not row:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Item not found'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return json_response(404, {'error': 'Item not found'})
         
         result = {
             'id': row[0],
             'title': row[1],
-            'targetAmount': float(row[2]),
-            'savedAmount': float(row[3]),
-            'targetDate': row[4].isoformat() if row[4] else None,
+            'targetAmount': row[2],
+            'savedAmount': row[3],
+            'targetDate': row[4],
             'category': row[5],
             'isCompleted': row[6],
-            'createdAt': row[7].isoformat() if row[7] else None
+            'createdAt': row[7]
         }
     else:
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid type'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return json_response(400, {'error': 'Invalid type'})
     
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'item': result}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {'item': result})
 
-def get_deposits(user_id: int, planning_id: str) -> dict:
-    '''Получает историю пополнений для цели'''
+def get_deposits(user_id: int, query_params: dict) -> dict:
+    '''Получает историю пополнений для цели, по страницам и с помесячными итогами по запросу'''
+    
+    planning_id = query_params.get('id')
+    where_conditions = ['p.user_id = %s', 'pd.planning_id = %s']
+    params = [user_id, planning_id]
+    
+    # Постраничный режим включается параметром limit; без него ответ прежний
+    paged = 'limit' in query_params
+    if paged:
+        try:
+            limit = min(max(int(query_params['limit']), 1), MAX_PAGE_SIZE)
+            cursor = decode_deposit_cursor(query_params['cursor']) if query_params.get('cursor') else None
+        except ValueError:
+            return json_response(400, {'error': 'Invalid limit or cursor'})
+        
+        if cursor:
+            where_conditions.append('(pd.created_at, pd.id) < (%s, %s)')
+            params.extend(cursor)
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
-    cur.execute(f'''
+    where_clause = ' AND '.join(where_conditions)
+    query = f'''
         SELECT pd.id, pd.amount, pd.comment, pd.created_at
         FROM {schema}.planning_deposits pd
         JOIN {schema}.planning p ON pd.planning_id = p.id
-        WHERE p.user_id = %s AND pd.planning_id = %s
-        ORDER BY pd.created_at DESC
-    ''', (user_id, planning_id))
+        WHERE {where_clause}
+        ORDER BY pd.created_at DESC, pd.id DESC
+    '''
+    if paged:
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        query += ' LIMIT %s'
+        params.append(limit + 1)
+    
+    cur.execute(query, params)
     
     rows = cur.fetchall()
+    next_cursor = None
+    if paged and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_deposit_cursor(rows[-1][3], rows[-1][0])
+    
     deposits = []
     for row in rows:
         deposits.append({
             'id': row[0],
-            'amount': float(row[1]),
+            'amount': row[1],
             'comment': row[2] or '',
-            'createdAt': row[3].isoformat() if row[3] else None
+            'createdAt': row[3]
         })
     
+    response_body = {'deposits': deposits}
+    if paged:
+        response_body['nextCursor'] = next_cursor
+    
+    # Итоги по месяцам считаются в БД по всей истории цели, а не по текущей странице
+    if query_params.get('rollup') == 'month':
+        cur.execute(f'''
+            SELECT to_char(date_trunc('month', pd.created_at), 'YYYY-MM'), COUNT(*), SUM(pd.amount)
+            FROM {schema}.planning_deposits pd
+            JOIN {schema}.planning p ON pd.planning_id = p.id
+            WHERE p.user_id = %s AND pd.planning_id = %s
+            GROUP BY 1
+            ORDER BY 1 DESC
+        ''', (user_id, planning_id))
+        
+        response_body['months'] = [
+            {'month': row[0], 'count': row[1], 'total': row[2]}
+            for row in cur.fetchall()
+        ]
+    
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'deposits': deposits}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, response_body)
 
-def update_deposit(user_id: int, deposit_id: int, planning_id: int, new_amount: float, new_comment: str) -> dict:
-    '''Обновляет трату в планировании'''
+def get_deposits_for_goals(user_id: int, query_params: dict) -> dict:
+    '''Получает первые страницы истории пополнений сразу для нескольких целей одним запросом'''
+    
+    try:
+        planning_ids = sorted({int(part) for part in query_params['ids'].split(',') if part.strip()})
+        limit = min(max(int(query_params.get('limit') or MAX_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return json_response(400, {'error': 'Invalid ids or limit'})
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    if not planning_ids:
+        return json_response(400, {'error': 'Missing ids'})
+    if len(planning_ids) > MAX_GOALS_PER_REQUEST:
+        return json_response(400, {'error': f'Too many ids, max {MAX_GOALS_PER_REQUEST}'})
+    
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
+    # Нумерация внутри каждой цели идёт по индексу (planning_id, created_at DESC, id DESC);
+    # лишняя строка на цель показывает, есть ли продолжение
     cur.execute(f'''
-        SELECT pd.amount
-        FROM {schema}.planning_deposits pd
-        JOIN {schema}.planning p ON pd.planning_id = p.id
-        WHERE pd.id = %s AND p.user_id = %s
-    ''', (deposit_id, user_id))
+        SELECT planning_id, id, amount, comment, created_at
+        FROM (
+            SELECT pd.planning_id, pd.id, pd.amount, pd.comment, pd.created_at,
+                   ROW_NUMBER() OVER (PARTITION BY pd.planning_id ORDER BY pd.created_at DESC, pd.id DESC) AS position
+            FROM {schema}.planning_deposits pd
+            JOIN {schema}.planning p ON pd.planning_id = p.id
+            WHERE p.user_id = %s AND pd.planning_id = ANY(%s)
+        ) ranked
+        WHERE position <= %s
+        ORDER BY planning_id, position
+    ''', (user_id, planning_ids, limit + 1))
+    
+    deposits = {planning_id: [] for planning_id in planning_ids}
+    next_cursors = {planning_id: None for planning_id in planning_ids}
+    for row in cur.fetchall():
+        goal_deposits = deposits[row[0]]
+        if len(goal_deposits) == limit:
+            last = goal_deposits[-1]
+            next_cursors[row[0]] = encode_deposit_cursor(last['createdAt'], last['id'])
+            continue
+        goal_deposits.append({
+            'id': row[1],
+            'amount': row[2],
+            'comment': row[3] or '',
+            'createdAt': row[4]
+        })
     
-    result = cur.fetchone()
-    if not result:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Deposit not found'}),
-            'isBase64Encoded': False
-        }
+    cur.close()
+    release_connection(conn)
     
-    old_amount = float(result[0])
-    amount_diff = new_amount - old_amount
+    # orjson принимает только строковые ключи, поэтому id целей отдаём строками
+    return json_response(200, {
+        'deposits': {str(planning_id): items for planning_id, items in deposits.items()},
+        'nextCursors': {str(planning_id): cursor for planning_id, cursor in next_cursors.items()}
+    })
+
+def encode_deposit_cursor(created_at: datetime, deposit_id: int) -> str:
+    '''Кодирует позицию (created_at, id) последнего пополнения страницы в непрозрачный курсор'''
+    raw = f'{created_at.isoformat()}|{deposit_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_deposit_cursor(cursor: str) -> tuple:
+    '''Разбирает курсор обратно в (created_at, id); бросает ValueError на мусоре'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, deposit_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(deposit_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def update_deposit(user_id: int, deposit_id: int, planning_id: int, new_amount: float, new_comment: str) -> dict:
+    '''Обновляет трату в планировании'''
     
-    cur.execute(f'''
-        UPDATE {schema}.planning_deposits
-        SET amount = %s, comment = %s, updated_at = CURRENT_TIMESTAMP
-        WHERE id = %s
-    ''', (new_amount, new_comment, deposit_id))
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
+    # Один оператор: разница считается в NUMERIC по заблокированной строке,
+    # поэтому параллельные правки не разводят saved_amount
     cur.execute(f'''
-        UPDATE {schema}.planning
-        SET saved_amount = saved_amount + %s, updated_at = CURRENT_TIMESTAMP
-        WHERE id = %s
-    ''', (amount_diff, planning_id))
-    
+        WITH old AS (
+            SELECT pd.id, pd.planning_id, pd.amount
+            FROM {schema}.planning_deposits pd
+            JOIN {schema}.planning p ON pd.planning_id = p.id
+            WHERE pd.id = %(deposit_id)s AND p.id = %(planning_id)s AND p.user_id = %(user_id)s
+            FOR UPDATE OF pd
+        ), updated AS (
+            UPDATE {schema}.planning_deposits pd
+            SET amount = %(amount)s, comment = %(comment)s, updated_at = CURRENT_TIMESTAMP
+            FROM old
+            WHERE pd.id = old.id
+            RETURNING pd.planning_id, pd.amount - old.amount AS diff
+        )
+        UPDATE {schema}.planning p
+        SET saved_amount = p.saved_amount + updated.diff, updated_at = CURRENT_TIMESTAMP
+        FROM updated
+        WHERE p.id = updated.planning_id
+        RETURNING p.id
+    ''', {'deposit_id': deposit_id, 'planning_id': planning_id, 'user_id': user_id, 'amount': new_amount, 'comment': new_comment})
+    
+    updated = cur.fetchone() is not None
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True}),
-        'isBase64Encoded': False
-    }
+    if not updated:
+        return json_response(404, {'error': 'Deposit not found'})
+    
+    return json_response(200, {'success': True})
 
 def delete_deposit(user_id: int, query_params: dict) -> dict:
     '''Удаляет конкретную трату из истории'''
@@ -464,58 +702,36 @@ def delete_deposit(user_id: int, query_params: dict) -> dict:
     planning_id = query_params.get('id')
     
     if not deposit_id or not planning_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Missing depositId or id'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Missing depositId or id'})
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
+    # Вычитаем ровно ту сумму, которую вернул DELETE, в том же операторе
     cur.execute(f'''
-        SELECT pd.amount
-        FROM {schema}.planning_deposits pd
-        JOIN {schema}.planning p ON pd.planning_id = p.id
-        WHERE pd.id = %s AND p.id = %s AND p.user_id = %s
-    ''', (deposit_id, planning_id, user_id))
-    
-    result = cur.fetchone()
-    if not result:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Deposit not found'}),
-            'isBase64Encoded': False
-        }
-    
-    deposit_amount = float(result[0])
-    
-    cur.execute(f'''
-        DELETE FROM {schema}.planning_deposits
-        WHERE id = %s
-    ''', (deposit_id,))
-    
-    cur.execute(f'''
-        UPDATE {schema}.planning
-        SET saved_amount = saved_amount - %s, updated_at = CURRENT_TIMESTAMP
-        WHERE id = %s
-    ''', (deposit_amount, planning_id))
-    
+        WITH removed AS (
+            DELETE FROM {schema}.planning_deposits pd
+            USING {schema}.planning p
+            WHERE pd.planning_id = p.id AND pd.id = %(deposit_id)s AND p.id = %(planning_id)s AND p.user_id = %(user_id)s
+            RETURNING pd.planning_id, pd.amount
+        )
+        UPDATE {schema}.planning p
+        SET saved_amount = p.saved_amount - removed.amount, updated_at = CURRENT_TIMESTAMP
+        FROM removed
+        WHERE p.id = removed.planning_id
+        RETURNING p.id
+    ''', {'deposit_id': deposit_id, 'planning_id': planning_id, 'user_id': user_id})
+    
+    deleted = cur.fetchone() is not None
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True}),
-        'isBase64Encoded': False
-    }
+    if not deleted:
+        return json_response(404, {'error': 'Deposit not found'})
+    
+    return json_response(200, {'success': True})
 
 def delete_item(user_id: int, query_params: dict) -> dict:
     '''Удаляет фиксированный расход или план'''
@@ -524,14 +740,9 @@ def delete_item(user_id: int, query_params: dict) -> dict:
     resource_type = query_params.get('type')
     
     if not item_id or not resource_type:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Missing id or type'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Missing id or type'})
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    conn = get_connection()
     cur = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
@@ -539,9 +750,10 @@ def delete_item(user_id: int, query_params: dict) -> dict:
     
     if resource_type == 'planning':
         cur.execute(f'''
-            DELETE FROM {schema}.planning_deposits
-            WHERE planning_id = %s
-        ''', (item_id,))
+            DELETE FROM {schema}.planning_deposits pd
+            USING {schema}.planning p
+            WHERE pd.planning_id = p.id AND p.id = %s AND p.user_id = %s
+        ''', (item_id, user_id))
     
     cur.execute(f'''
         DELETE FROM {schema}.{table}
@@ -551,19 +763,234 @@ def delete_item(user_id: int, query_params: dict) -> dict:
     conn.commit()
     deleted = cur.rowcount > 0
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     if deleted:
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'success': True})
     else:
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Item not found'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(404, {'error': 'Item not found'})
+
+def get_forecasts(user_id: int) -> dict:
+    '''Прогноз по всем целям пользователя: темп пополнений, дата достижения и нужный ежемесячный взнос'''
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    # Агрегаты по истории дешёвые и служат версией: новое, изменённое или удалённое пополнение её меняет
+    cur.execute(f'''
+        SELECT p.id, p.target_amount, COALESCE(p.saved_amount, 0), p.target_date, p.created_at, p.is_completed,
+               COUNT(pd.id), MAX(pd.id), MAX(pd.updated_at)
+        FROM {schema}.planning p
+        LEFT JOIN {schema}.planning_deposits pd ON pd.planning_id = p.id
+        WHERE p.user_id = %s
+        GROUP BY p.id
+        ORDER BY p.id
+    ''', (user_id,))
+    
+    goals = cur.fetchall()
+    now = datetime.now()
+    # Дата в версии: запасной темп зависит от возраста цели, поэтому раз в сутки пересчитываем
+    versions = {row[0]: (row[6], row[7], row[8], now.date()) for row in goals}
+    
+    rates = {}
+    stale_ids = []
+    for planning_id, version in versions.items():
+        rate = get_cached_forecast_rate(planning_id, version)
+        if rate is None:
+            stale_ids.append(planning_id)
+        else:
+            rates[planning_id] = rate
+    
+    if stale_ids:
+        cur.execute(f'''
+            SELECT planning_id, amount, created_at
+            FROM {schema}.planning_deposits
+            WHERE planning_id = ANY(%s)
+            ORDER BY planning_id, created_at, id
+        ''', (stale_ids,))
+        
+        goal_created = {row[0]: row[4] for row in goals}
+        fresh_rates = estimate_deposit_rates(stale_ids, cur.fetchall(), [goal_created[planning_id] for planning_id in stale_ids], now)
+        for planning_id, rate in zip(stale_ids, fresh_rates):
+            cache_forecast_rate(planning_id, versions[planning_id], rate)
+            rates[planning_id] = rate
+    
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {'forecasts': project_goals(goals, rates, now.date())})
+
+def get_cached_forecast_rate(planning_id: int, version: tuple):
+    '''Возвращает темп цели из кэша, если история пополнений с тех пор не менялась'''
+    cached = _forecast_cache.get(planning_id)
+    if cached and cached[0] == version:
+        _forecast_cache.move_to_end(planning_id)
+        _forecast_cache_stats['hits'] += 1
+        return cached[1]
+    
+    _forecast_cache_stats['misses'] += 1
+    return None
+
+def cache_forecast_rate(planning_id: int, version: tuple, rate: float):
+    '''Кладёт темп цели в кэш вместе с версией её истории'''
+    _forecast_cache[planning_id] = (version, rate)
+    _forecast_cache.move_to_end(planning_id)
+    if len(_forecast_cache) > FORECAST_CACHE_MAX_SIZE:
+        _forecast_cache.popitem(last=False)
+
+def estimate_deposit_rates(planning_ids: list, deposit_rows: list, goal_created: list, now: datetime) -> list:
+    '''Темп пополнений в день для каждой цели сразу по всей истории: наклон накопленной суммы по времени
+    методом наименьших квадратов, а при короткой истории — среднее с момента создания цели'''
+    import numpy as np
+    
+    goal_count = len(planning_ids)
+    position = {planning_id: index for index, planning_id in enumerate(planning_ids)}
+    epoch = datetime(1970, 1, 1)
+    now_days = (now - epoch).total_seconds() / 86400
+    
+    # Строки отсортированы по цели и времени, поэтому группы идут подряд
+    groups = np.fromiter((position[row[0]] for row in deposit_rows), dtype=np.int64, count=len(deposit_rows))
+    amounts = np.fromiter((row[1] for row in deposit_rows), dtype=np.float64, count=len(deposit_rows))
+    days = np.fromiter(((row[2] - epoch).total_seconds() / 86400 if row[2] else now_days for row in deposit_rows),
+                       dtype=np.float64, count=len(deposit_rows))
+    created_days = np.array([(created - epoch).total_seconds() / 86400 if created else now_days for created in goal_created])
+    
+    counts = np.bincount(groups, minlength=goal_count)
+    totals = np.bincount(groups, weights=amounts, minlength=goal_count)
+    
+    # Накопленная сумма внутри каждой цели: общий cumsum минус всё, что было до начала группы
+    cumulative = np.cumsum(amounts)
+    before_group = np.zeros(goal_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    non_empty = counts > 0
+    before_group[non_empty] = cumulative[starts[non_empty]] - amounts[starts[non_empty]]
+    cumulative -= np.repeat(before_group, counts)
+    
+    safe_counts = np.maximum(counts, 1)
+    mean_days = np.bincount(groups, weights=days, minlength=goal_count) / safe_counts
+    mean_cumulative = np.bincount(groups, weights=cumulative, minlength=goal_count) / safe_counts
+    day_offsets = days - mean_days[groups]
+    covariance = np.bincount(groups, weights=day_offsets * (cumulative - mean_cumulative[groups]), minlength=goal_count)
+    variance = np.bincount(groups, weights=day_offsets * day_offsets, minlength=goal_count)
+    
+    first_day = np.full(goal_count, np.inf)
+    last_day = np.full(goal_count, -np.inf)
+    np.minimum.at(first_day, groups, days)
+    np.maximum.at(last_day, groups, days)
+    
+    has_trend = (counts >= 2) & (last_day - first_day >= FORECAST_MIN_SPAN_DAYS)
+    slope = np.divide(covariance, variance, out=np.zeros(goal_count), where=variance > 0)
+    average = totals / np.maximum(now_days - created_days, FORECAST_MIN_SPAN_DAYS)
+    
+    return np.maximum(np.where(has_trend, slope, average), 0).tolist()
+
+def project_goals(goals: list, rates: dict, today: date) -> list:
+    '''Проецирует все цели разом: когда накопится целевая сумма при текущем темпе и сколько нужно вносить в месяц к сроку'''
+    import numpy as np
+    
+    if not goals:
+        return []
+    
+    target = np.array([float(row[1]) for row in goals])
+    saved = np.array([float(row[2]) for row in goals])
+    rate = np.array([rates[row[0]] for row in goals])
+    has_date = np.array([row[3] is not None for row in goals])
+    days_left = np.array([(row[3] - today).days if row[3] else 0 for row in goals], dtype=np.float64)
+    done = np.array([bool(row[5]) for row in goals]) | (saved >= target)
+    
+    remaining = np.maximum(target - saved, 0)
+    days_to_target = np.divide(remaining, rate, out=np.full(len(goals), np.inf), where=rate > 0)
+    reachable = days_to_target <= FORECAST_MAX_YEARS * 365.25
+    # Срок прошёл или меньше месяца — остаток нужен целиком
+    required_monthly = remaining / np.maximum(days_left / AVG_DAYS_PER_MONTH, 1)
+    on_track = done | (days_to_target <= days_left)
+    
+    forecasts = []
+    for index, row in enumerate(goals):
+        forecasts.append({
+            'planningId': row[0],
+            'monthlyRate': round(float(rate[index]) * AVG_DAYS_PER_MONTH, 2),
+            'remaining': round(float(remaining[index]), 2),
+            'projectedCompletion': None if done[index] or not reachable[index] else today + timedelta(days=int(np.ceil(days_to_target[index]))),
+            'requiredMonthly': round(float(required_monthly[index]), 2) if has_date[index] and not done[index] else None,
+            'onTrack': bool(on_track[index]) if has_date[index] else None,
+            'isCompleted': bool(done[index])
+        })
+    
+    return forecasts
+
+def reconcile_saved_amounts(body: dict) -> dict:
+    '''Сверяет planning.saved_amount с суммой пополнений одним проходом по всем целям, сообщает о расхождениях и при repair чинит их'''
+    repair = bool(body.get('repair'))
+    user_id = body.get('userId')
+    
+    try:
+        planning_ids = [int(planning_id) for planning_id in body['planningIds']] if body.get('planningIds') else None
+    except (TypeError, ValueError):
+        return json_response(400, {'error': 'Invalid planningIds'})
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    if repair:
+        # Ждём незакоммиченные пополнения и не пускаем новые до конца пересчёта
+        cur.execute(f'LOCK TABLE {schema}.planning_deposits IN SHARE MODE')
+    
+    filters = []
+    if user_id:
+        filters.append('p.user_id = %(user_id)s')
+    if planning_ids:
+        filters.append('p.id = ANY(%(planning_ids)s)')
+    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ''
+    params = {'user_id': user_id, 'planning_ids': planning_ids}
+    
+    actual_query = f'''
+        SELECT p.id, p.user_id, p.saved_amount, COALESCE(SUM(pd.amount), 0) AS deposit_total, COUNT(pd.id) AS deposit_count
+        FROM {schema}.planning p
+        LEFT JOIN {schema}.planning_deposits pd ON pd.planning_id = p.id
+        {where_clause}
+        GROUP BY p.id
+    '''
+    
+    cur.execute(f'''
+        SELECT id, user_id, COALESCE(saved_amount, 0), deposit_total, deposit_count
+        FROM ({actual_query}) totals
+        WHERE saved_amount IS DISTINCT FROM deposit_total
+        ORDER BY user_id, id
+    ''', params)
+    
+    drift = []
+    for row in cur.fetchall():
+        drift.append({
+            'planningId': row[0],
+            'userId': row[1],
+            'storedAmount': row[2],
+            'depositTotal': row[3],
+            'depositCount': row[4]
+        })
+    
+    # Цели без единого пополнения копили до появления planning_deposits (V0006):
+    # их saved_amount не из чего пересчитать, и repair их не трогает
+    repairable = [item for item in drift if item['depositCount'] > 0]
+    
+    if repair and repairable:
+        cur.execute(f'''
+            UPDATE {schema}.planning p
+            SET saved_amount = totals.deposit_total, updated_at = CURRENT_TIMESTAMP
+            FROM ({actual_query}) totals
+            WHERE p.id = totals.id AND totals.deposit_count > 0
+              AND p.saved_amount IS DISTINCT FROM totals.deposit_total
+        ''', params)
+    
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {
+        'driftCount': len(drift),
+        'drift': drift[:MAX_DRIFT_REPORT],
+        'repairedCount': len(repairable) if repair else 0,
+        'skippedWithoutDeposits': len(drift) - len(repairable)
+    })
@@ -1,9 +1,101 @@
 import json
 import os
-from datetime import datetime
-import jwt
-import psycopg2
-from decimal import Decimal
+from datetime import datetime, date, timedelta
+import time
+import hashlib
+import hmac
+import base64
+import binascii
+import csv
+import io
+from collections import OrderedDict, defaultdict
+from decimal import Decimal, InvalidOperation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Заголовки ответов собираются один раз при холодном старте
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, If-None-Match'
+}
+# Клиент обязан перепроверять кэш по ETag перед каждым использованием
+CACHEABLE_HEADERS = {
+    **JSON_HEADERS,
+    'Cache-Control': 'private, no-cache',
+    'Access-Control-Expose-Headers': 'ETag'
+}
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+# Соединение, оборванное сервером или балансировщиком, без запроса не отличить от живого:
+# по умолчанию проверяем SELECT 1 при каждой выдаче из пула, окно в секундах задаётся явно
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', '0'))
+
+# Пул переживает тёплые вызовы handler: (соединение, время возврата в пул)
+_db_pool = []
+_db_pool_stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_ALGORITHMS = ['HS256']
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', '1024'))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', '300'))
+
+# Кэш проверенных токенов: sha256(токен) -> (user_id, момент истечения), порядок LRU
+_token_cache = OrderedDict()
+_token_cache_stats = {'hits': 0, 'misses': 0}
+
+MAX_PAGE_SIZE = 500
+MAX_TREND_MONTHS = 60
+MAX_DRIFT_REPORT = 100
+MAX_IMPORT_ROWS = 50000
+MAX_IMPORT_ERRORS = 200
+MAX_BATCH_OPERATIONS = 200
+
+FIXED_COLUMNS = 'id, title, amount, category, day_of_month, is_active, created_at'
+PLANNING_COLUMNS = 'id, title, target_amount, saved_amount, target_date, category, is_completed, created_at'
+
+EXPORT_ITERSIZE = 2000
+# Размер части выгрузки в байтах UTF-8 (лимит ответа функции считается в байтах,
+# кириллица занимает по 2 байта); продолжение — по заголовку X-Next-Cursor
+EXPORT_CHUNK_BYTES = 2 * 1024 * 1024
+
+# Ресурсы выгрузки по порядку: (имя, колонки, FROM ... WHERE по пользователю, колонка id)
+EXPORT_RESOURCES = [
+    ('incomes', ['id', 'amount', 'description', 'date', 'created_at'],
+     '{schema}.incomes t WHERE t.user_id = %s', 't.id'),
+    ('expenses', ['id', 'amount', 'category', 'description', 'date', 'created_at'],
+     '{schema}.expenses t WHERE t.user_id = %s', 't.id'),
+    ('fixed_expenses', ['id', 'title', 'amount', 'category', 'day_of_month', 'is_active', 'created_at'],
+     '{schema}.fixed_expenses t WHERE t.user_id = %s', 't.id'),
+    ('planning', ['id', 'title', 'target_amount', 'saved_amount', 'target_date', 'category', 'is_completed', 'created_at', 'updated_at'],
+     '{schema}.planning t WHERE t.user_id = %s', 't.id'),
+    ('planning_deposits', ['id', 'planning_id', 'amount', 'comment', 'created_at', 'updated_at'],
+     '{schema}.planning_deposits t JOIN {schema}.planning p ON p.id = t.planning_id WHERE p.user_id = %s', 't.id'),
+]
+
+# Сколько хранятся tombstones; клиент со старой меткой получает fullResync
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+MAX_SYNC_ROWS = 2000
+
+# Ресурсы синхронизации: (ключ ответа и журнала удалений, колонки -> поля, FROM ... WHERE по пользователю)
+SYNC_RESOURCES = [
+    ('incomes', [('id', 'id'), ('amount', 'amount'), ('description', 'description'), ('date', 'date')],
+     '{schema}.incomes t WHERE t.user_id = %s'),
+    ('expenses', [('id', 'id'), ('amount', 'amount'), ('category', 'category'), ('description', 'description'), ('date', 'date')],
+     '{schema}.expenses t WHERE t.user_id = %s'),
+    ('fixed', [('id', 'id'), ('title', 'title'), ('amount', 'amount'), ('category', 'category'),
+               ('day_of_month', 'dayOfMonth'), ('is_active', 'isActive'), ('created_at', 'createdAt')],
+     '{schema}.fixed_expenses t WHERE t.user_id = %s'),
+    ('planning', [('id', 'id'), ('title', 'title'), ('target_amount', 'targetAmount'), ('saved_amount', 'savedAmount'),
+                  ('target_date', 'targetDate'), ('category', 'category'), ('is_completed', 'isCompleted'), ('created_at', 'createdAt')],
+     '{schema}.planning t WHERE t.user_id = %s'),
+    ('deposits', [('id', 'id'), ('planning_id', 'planningId'), ('amount', 'amount'), ('comment', 'comment'), ('created_at', 'createdAt')],
+     '{schema}.planning_deposits t JOIN {schema}.planning p ON p.id = t.planning_id WHERE p.user_id = %s'),
+]
 
 def handler(event: dict, context) -> dict:
     '''API для управления доходами и расходами пользователей'''
@@ -13,39 +105,49 @@ def handler(event: dict, context) -> dict:
     query_params = event.get('queryStringParameters') or {}
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': '', 'isBase64Encoded': False}
     
-    auth_header = headers.get('x-authorization') or headers.get('X-Authorization') or headers.get('authorization') or headers.get('Authorization')
-    if not auth_header:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Authorization required'}),
-            'isBase64Encoded': False
-        }
+    if method == 'POST' and is_service_request(headers):
+        body = json.loads(event.get('body', '{}'))
+        if body.get('action') == 'rebuild_rollups':
+            return rebuild_rollups(body)
+        if body.get('action') == 'purge_tombstones':
+            return purge_tombstones(body)
+        return json_response(400, {'error': 'Unknown service action'})
+    
+    token = get_bearer_token(headers)
+    if not token:
+        return json_response(401, {'error': 'Authorization required'})
     
-    token = auth_header.replace('Bearer ', '')
     user_id = verify_token(token)
     
     if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Invalid token'})
+    
+    if method == 'GET' and query_params.get('action') == 'bootstrap':
+        return get_bootstrap(user_id, query_params)
+    
+    if method == 'GET' and query_params.get('action') == 'summary':
+        return get_summary(user_id, query_params)
+    
+    if method == 'GET' and query_params.get('action') == 'trend':
+        return get_trend(user_id, query_params)
+    
+    if method == 'GET' and query_params.get('action') == 'sync':
+        return get_sync(user_id, query_params)
     
     if method == 'GET' and 'type' in query_params:
-        return get_transactions(user_id, query_params)
+        return get_transactions(user_id, query_params, headers)
+    
+    if method == 'GET' and query_params.get('action') == 'export':
+        return export_ledger(user_id, query_params)
+    
+    if method == 'POST' and query_params.get('action') == 'import':
+        return import_transactions(user_id, event, query_params)
+    
+    if method == 'POST' and query_params.get('action') == 'batch':
+        body = json.loads(event.get('body', '{}'))
+        return run_batch(user_id, body)
     
     if method == 'POST':
         body = json.loads(event.get('body', '{}'))
@@ -54,30 +156,194 @@ def handler(event: dict, context) -> dict:
     if method == 'DELETE' and 'id' in query_params:
         return delete_transaction(user_id, query_params)
     
+    return json_response(400, {'error': 'Invalid request'})
+
+def get_bearer_token(headers: dict):
+    '''Достаёт токен из X-Authorization или Authorization независимо от регистра заголовка'''
+    lowered = {name.lower(): value for name, value in headers.items()}
+    auth_header = lowered.get('x-authorization') or lowered.get('authorization')
+    if not auth_header:
+        return None
+    return auth_header.replace('Bearer ', '')
+
+def json_response(status_code: int, payload, headers: dict = JSON_HEADERS) -> dict:
+    '''Собирает ответ функции с JSON-телом'''
     return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid request'}),
+        'statusCode': status_code,
+        'headers': headers,
+        'body': encode_json(payload),
         'isBase64Encoded': False
     }
 
+def encode_json(payload) -> str:
+    '''Кодирует тело ответа: через orjson, если он установлен, иначе стандартным json'''
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default).decode()
+    return json.dumps(payload, default=json_default)
+
+def json_default(value):
+    '''Сериализует Decimal и даты из строк БД без поэлементного преобразования'''
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def get_resource_etag(cur, schema: str, user_id: int, resource: str, query_params: dict) -> str:
+    '''Строит ETag из счётчика изменений ресурса и параметров запроса'''
+    cur.execute(f'''
+        SELECT version FROM {schema}.resource_versions
+        WHERE user_id = %s AND resource = %s
+    ''', (user_id, resource))
+    row = cur.fetchone()
+    version = row[0] if row else 0
+    
+    params_digest = hashlib.sha1(json.dumps(sorted(query_params.items())).encode()).hexdigest()[:12]
+    return f'W/"{resource}-{user_id}-{version}-{params_digest}"'
+
+def is_not_modified(request_headers: dict, etag: str) -> bool:
+    '''Сравнивает ETag с заголовком If-None-Match клиента'''
+    lowered = {name.lower(): value for name, value in (request_headers or {}).items()}
+    if_none_match = lowered.get('if-none-match')
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+def not_modified_response(etag: str) -> dict:
+    '''Ответ 304 без тела'''
+    return {'statusCode': 304, 'headers': {**CACHEABLE_HEADERS, 'ETag': etag}, 'body': '', 'isBase64Encoded': False}
+
+def get_connection():
+    '''Берёт живое соединение из пула или открывает новое'''
+    import psycopg2
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if is_connection_alive(conn, released_at):
+            _db_pool_stats['hits'] += 1
+            return conn
+        _db_pool_stats['stale'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    
+    _db_pool_stats['misses'] += 1
+    print(f"[db-pool] new connection: hits={_db_pool_stats['hits']} misses={_db_pool_stats['misses']} stale={_db_pool_stats['stale']}")
+    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+
+def is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверяет соединение перед повторным использованием'''
+    import psycopg2
+    import psycopg2.extensions
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if time.monotonic() - released_at < DB_POOL_PING_AFTER:
+        return True
+    
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def release_connection(conn):
+    '''Возвращает соединение в пул (или закрывает, если пул заполнен)'''
+    import psycopg2
+    if conn.closed:
+        return
+    
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        return
+    
+    if len(_db_pool) < DB_POOL_MAX_SIZE:
+        _db_pool.append((conn, time.monotonic()))
+    else:
+        conn.close()
+
+def is_service_request(headers: dict) -> bool:
+    '''Проверяет служебный ключ для запусков по расписанию и обслуживания'''
+    service_key = os.environ.get('SERVICE_API_KEY')
+    provided_key = headers.get('x-service-key') or headers.get('X-Service-Key')
+    if not service_key or not provided_key:
+        return False
+    return hmac.compare_digest(service_key, provided_key)
+
 def verify_token(token: str):
-    '''Проверяет JWT токен и возвращает user_id'''
-    jwt_secret = os.environ.get('JWT_SECRET')
+    '''Проверяет JWT токен и возвращает user_id (проверенные токены кэшируются до exp)'''
+    import jwt
+    now = time.time()
+    cache_key = hashlib.sha256(token.encode()).digest()
+    
+    cached = _token_cache.get(cache_key)
+    if cached:
+        user_id, expires_at = cached
+        if expires_at > now:
+            _token_cache.move_to_end(cache_key)
+            _token_cache_stats['hits'] += 1
+            return user_id
+        del _token_cache[cache_key]
+    
+    _token_cache_stats['misses'] += 1
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload['user_id']
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
         return None
+    
+    user_id = payload.get('user_id')
+    if not user_id:
+        return None
+    
+    # Без exp токен всё равно перепроверяется не реже раза в TOKEN_CACHE_TTL секунд
+    expires_at = min(payload.get('exp', now + TOKEN_CACHE_TTL), now + TOKEN_CACHE_TTL)
+    _token_cache[cache_key] = (user_id, expires_at)
+    if len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+    
+    print(f"[token-cache] miss: hits={_token_cache_stats['hits']} misses={_token_cache_stats['misses']} size={len(_token_cache)}")
+    return user_id
 
-def get_transactions(user_id: int, query_params: dict) -> dict:
+def get_transactions(user_id: int, query_params: dict, request_headers: dict) -> dict:
     '''Получает транзакции пользователя'''
     transaction_type = query_params.get('type')
     year = query_params.get('year')
     month = query_params.get('month')
     
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    where_conditions = ['user_id = %s']
+    params = [user_id]
+    
+    if year and month:
+        try:
+            month_start, month_end = get_month_range(int(year), int(month))
+        except ValueError:
+            return json_response(400, {'error': 'Invalid year or month'})
+        
+        # Полуинтервал [начало месяца, начало следующего) использует индекс (user_id, date)
+        where_conditions.append('date >= %s AND date < %s')
+        params.extend([month_start, month_end])
+    
+    # Постраничный режим включается параметром limit; без него ответ прежний
+    paged = 'limit' in query_params
+    if paged:
+        try:
+            limit = min(max(int(query_params['limit']), 1), MAX_PAGE_SIZE)
+            cursor = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+        except ValueError:
+            return json_response(400, {'error': 'Invalid limit or cursor'})
+        
+        if cursor:
+            where_conditions.append('(date, id) < (%s, %s)')
+            params.extend(cursor)
+    
+    conn = get_connection()
     cur = conn.cursor()
     
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
@@ -89,11 +355,12 @@ def get_transactions(user_id: int, query_params: dict) -> dict:
         table = 'expenses'
         select_columns = 'id, amount, category, description, date'
     
-    where_conditions = [f'user_id = {user_id}']
-    
-    if year and month:
-        where_conditions.append(f"EXTRACT(YEAR FROM date) = {year}")
-        where_conditions.append(f"EXTRACT(MONTH FROM date) = {month}")
+    # Если у клиента актуальная версия, не читаем и не сериализуем строки
+    etag = get_resource_etag(cur, schema, user_id, table, query_params)
+    if is_not_modified(request_headers, etag):
+        cur.close()
+        release_connection(conn)
+        return not_modified_response(etag)
     
     where_clause = ' AND '.join(where_conditions)
     
@@ -101,59 +368,659 @@ def get_transactions(user_id: int, query_params: dict) -> dict:
         SELECT {select_columns}
         FROM {schema}.{table}
         WHERE {where_clause}
-        ORDER BY date DESC
+        ORDER BY date DESC, id DESC
     '''
     
-    cur.execute(query)
+    if paged:
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        query += ' LIMIT %s'
+        params.append(limit + 1)
+    
+    cur.execute(query, params)
     rows = cur.fetchall()
     
+    next_cursor = None
+    if paged and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+    
     transactions = []
     for row in rows:
         if transaction_type == 'income':
             transactions.append({
                 'id': row[0],
-                'amount': float(row[1]),
+                'amount': row[1],
                 'description': row[2],
-                'date': row[3].isoformat()
+                'date': row[3]
             })
         else:
             transactions.append({
                 'id': row[0],
-                'amount': float(row[1]),
+                'amount': row[1],
                 'category': row[2],
                 'description': row[3],
-                'date': row[4].isoformat()
+                'date': row[4]
             })
     
     cur.close()
-    conn.close()
+    release_connection(conn)
+    
+    response_body = {'transactions': transactions}
+    if paged:
+        response_body['nextCursor'] = next_cursor
+    
+    return json_response(200, response_body, {**CACHEABLE_HEADERS, 'ETag': etag})
+
+def encode_cursor(row_date: date, row_id: int) -> str:
+    '''Кодирует позицию (date, id) последней строки страницы в непрозрачный курсор'''
+    raw = f'{row_date.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    '''Разбирает курсор обратно в (date, id); бросает ValueError на мусоре'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        row_date, row_id = raw.split('|')
+        return date.fromisoformat(row_date), int(row_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def export_ledger(user_id: int, query_params: dict) -> dict:
+    '''Выгружает все данные пользователя в CSV или JSON Lines частями ограниченного размера'''
+    export_format = query_params.get('format', 'jsonl')
+    resource = query_params.get('resource', 'all')
+    resource_names = [item[0] for item in EXPORT_RESOURCES]
+    
+    if export_format not in ('jsonl', 'csv') or (resource != 'all' and resource not in resource_names):
+        return json_response(400, {'error': 'Invalid format or resource'})
+    if export_format == 'csv' and resource == 'all':
+        return json_response(400, {'error': 'CSV export needs a single resource'})
+    
+    # Курсор продолжения: номер ресурса и последний выгруженный id
+    try:
+        if query_params.get('cursor'):
+            raw = base64.urlsafe_b64decode(query_params['cursor'] + '=' * (-len(query_params['cursor']) % 4)).decode()
+            resource_index, last_id = (int(part) for part in raw.split('|'))
+        else:
+            resource_index = 0 if resource == 'all' else resource_names.index(resource)
+            last_id = 0
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return json_response(400, {'error': 'Invalid cursor'})
+    if resource_index < 0:
+        return json_response(400, {'error': 'Invalid cursor'})
+    
+    last_index = len(EXPORT_RESOURCES) - 1 if resource == 'all' else resource_names.index(resource)
+    
+    conn = get_connection()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    output = io.StringIO()
+    # CSV-строка пишется сначала в отдельный буфер, чтобы посчитать её байты
+    row_buffer = io.StringIO()
+    writer = csv.writer(row_buffer)
+    output_bytes = 0
+    next_cursor = None
+    
+    while resource_index <= last_index and next_cursor is None:
+        name, columns, source, id_column = EXPORT_RESOURCES[resource_index]
+        select_columns = ', '.join(f't.{column}' for column in columns)
+        
+        if export_format == 'csv' and last_id == 0:
+            writer.writerow(columns)
+            output_bytes += flush_export_row(row_buffer, output)
+        
+        # Серверный курсор: строки приходят пачками по itersize, а не целиком в память
+        cur = conn.cursor(name=f'export_{name}')
+        cur.itersize = EXPORT_ITERSIZE
+        cur.execute(f'''
+            SELECT {select_columns}
+            FROM {source.format(schema=schema)} AND {id_column} > %s
+            ORDER BY {id_column}
+        ''', (user_id, last_id))
+        
+        for row in cur:
+            if export_format == 'csv':
+                writer.writerow(row)
+            else:
+                record = dict(zip(columns, row))
+                record['resource'] = name
+                row_buffer.write(encode_json(record))
+                row_buffer.write('\n')
+            output_bytes += flush_export_row(row_buffer, output)
+            
+            last_id = row[0]
+            if output_bytes >= EXPORT_CHUNK_BYTES:
+                next_cursor = base64.urlsafe_b64encode(f'{resource_index}|{last_id}'.encode()).decode().rstrip('=')
+                break
+        
+        cur.close()
+        if next_cursor is None:
+            resource_index += 1
+            last_id = 0
+    
+    release_connection(conn)
+    
+    response_headers = {
+        **JSON_HEADERS,
+        'Content-Type': 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson; charset=utf-8',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor'
+    }
+    if next_cursor:
+        response_headers['X-Next-Cursor'] = next_cursor
     
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'transactions': transactions}),
+        'headers': response_headers,
+        'body': output.getvalue(),
         'isBase64Encoded': False
     }
 
+def flush_export_row(row_buffer: io.StringIO, output: io.StringIO) -> int:
+    '''Переносит строку выгрузки в общий буфер и возвращает её размер в байтах UTF-8'''
+    text = row_buffer.getvalue()
+    row_buffer.seek(0)
+    row_buffer.truncate()
+    output.write(text)
+    return len(text.encode('utf-8'))
+
+def get_summary(user_id: int, query_params: dict) -> dict:
+    '''Возвращает сводку за месяц: итоги, суммы по категориям, дневной ряд и изменения к прошлому месяцу'''
+    current_date = datetime.now()
+    
+    try:
+        year = int(query_params.get('year') or current_date.year)
+        month = int(query_params.get('month') or current_date.month)
+        get_month_range(year, month)
+    except ValueError:
+        return json_response(400, {'error': 'Invalid year or month'})
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    summary = fetch_summary(cur, schema, user_id, year, month)
+    
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, summary)
+
+def fetch_summary(cur, schema: str, user_id: int, year: int, month: int) -> dict:
+    '''Считает сводку за месяц на переданном курсоре'''
+    month_start, month_end = get_month_range(year, month)
+    prev_year, prev_month = (year - 1, 12) if month == 1 else (year, month - 1)
+    
+    # Итоги и категории текущего и прошлого месяца берём из помесячных итогов
+    cur.execute(f'''
+        SELECT kind, category, year = %s AND month = %s, total_amount, tx_count
+        FROM {schema}.monthly_rollups
+        WHERE user_id = %s AND (year, month) IN ((%s, %s), (%s, %s))
+    ''', (year, month, user_id, year, month, prev_year, prev_month))
+    
+    totals = {(True, 'expense'): [Decimal(0), 0], (True, 'income'): [Decimal(0), 0],
+              (False, 'expense'): [Decimal(0), 0], (False, 'income'): [Decimal(0), 0]}
+    categories = {}
+    for kind, category, is_current, amount, count in cur.fetchall():
+        totals[(is_current, kind)][0] += amount
+        totals[(is_current, kind)][1] += count
+        
+        if kind != 'expense':
+            continue
+        entry = categories.setdefault(category, {'amount': Decimal(0), 'count': 0, 'previousAmount': Decimal(0)})
+        if is_current:
+            entry['amount'] = amount
+            entry['count'] = count
+        else:
+            entry['previousAmount'] = amount
+    
+    cur.execute(f'''
+        SELECT date, SUM(expense), SUM(income)
+        FROM (
+            SELECT date, amount AS expense, 0 AS income
+            FROM {schema}.expenses
+            WHERE user_id = %(user_id)s AND date >= %(month_start)s AND date < %(month_end)s
+            UNION ALL
+            SELECT date, 0, amount
+            FROM {schema}.incomes
+            WHERE user_id = %(user_id)s AND date >= %(month_start)s AND date < %(month_end)s
+        ) t
+        GROUP BY date
+        ORDER BY date
+    ''', {'user_id': user_id, 'month_start': month_start, 'month_end': month_end})
+    
+    daily = []
+    for row in cur.fetchall():
+        daily.append({
+            'date': row[0],
+            'expenses': row[1],
+            'income': row[2]
+        })
+    
+    income, income_count = totals[(True, 'income')]
+    expenses, expense_count = totals[(True, 'expense')]
+    prev_income = totals[(False, 'income')][0]
+    prev_expenses = totals[(False, 'expense')][0]
+    
+    by_category = []
+    # Категория, по которой тратили только в прошлом месяце, остаётся в списке с amount = 0,
+    # чтобы было видно падение; пропускаем лишь обнулённые удалениями итоги обоих месяцев
+    for category, entry in sorted(categories.items(), key=lambda item: (item[1]['amount'], item[1]['previousAmount']), reverse=True):
+        if not entry['count'] and not entry['previousAmount']:
+            continue
+        by_category.append({
+            'category': category,
+            'amount': entry['amount'],
+            'count': entry['count'],
+            'previousAmount': entry['previousAmount'],
+            'delta': entry['amount'] - entry['previousAmount']
+        })
+    
+    return {
+        'year': year,
+        'month': month,
+        'totals': {
+            'income': income,
+            'expenses': expenses,
+            'balance': income - expenses,
+            'incomeCount': income_count,
+            'expenseCount': expense_count
+        },
+        'previous': {
+            'year': prev_year,
+            'month': prev_month,
+            'income': prev_income,
+            'expenses': prev_expenses,
+            'balance': prev_income - prev_expenses
+        },
+        'deltas': {
+            'income': income - prev_income,
+            'expenses': expenses - prev_expenses,
+            'balance': (income - expenses) - (prev_income - prev_expenses)
+        },
+        'byCategory': by_category,
+        'daily': daily
+    }
+
+def get_bootstrap(user_id: int, query_params: dict) -> dict:
+    '''Отдаёт всё для первого экрана за один запрос: пользователь, транзакции месяца, фиксированные расходы, цели и сводку'''
+    current_date = datetime.now()
+    
+    try:
+        year = int(query_params.get('year') or current_date.year)
+        month = int(query_params.get('month') or current_date.month)
+        month_start, month_end = get_month_range(year, month)
+    except ValueError:
+        return json_response(400, {'error': 'Invalid year or month'})
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    # Все чтения идут в одном снимке, чтобы списки и сводка были согласованы
+    cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+    
+    cur.execute(f'''
+        SELECT id, email, name FROM {schema}.users WHERE id = %s
+    ''', (user_id,))
+    
+    user = cur.fetchone()
+    if not user:
+        cur.close()
+        release_connection(conn)
+        return json_response(404, {'error': 'User not found'})
+    
+    cur.execute(f'''
+        SELECT id, amount, category, description, date
+        FROM {schema}.expenses
+        WHERE user_id = %s AND date >= %s AND date < %s
+        ORDER BY date DESC, id DESC
+    ''', (user_id, month_start, month_end))
+    
+    expenses = []
+    for row in cur.fetchall():
+        expenses.append({
+            'id': row[0],
+            'amount': row[1],
+            'category': row[2],
+            'description': row[3],
+            'date': row[4]
+        })
+    
+    cur.execute(f'''
+        SELECT id, amount, description, date
+        FROM {schema}.incomes
+        WHERE user_id = %s AND date >= %s AND date < %s
+        ORDER BY date DESC, id DESC
+    ''', (user_id, month_start, month_end))
+    
+    incomes = []
+    for row in cur.fetchall():
+        incomes.append({
+            'id': row[0],
+            'amount': row[1],
+            'description': row[2],
+            'date': row[3]
+        })
+    
+    cur.execute(f'''
+        SELECT id, title, amount, category, day_of_month, is_active, created_at
+        FROM {schema}.fixed_expenses
+        WHERE user_id = %s
+        ORDER BY day_of_month ASC
+    ''', (user_id,))
+    
+    fixed_expenses = []
+    for row in cur.fetchall():
+        fixed_expenses.append({
+            'id': row[0],
+            'title': row[1],
+            'amount': row[2],
+            'category': row[3],
+            'dayOfMonth': row[4],
+            'isActive': row[5],
+            'createdAt': row[6]
+        })
+    
+    cur.execute(f'''
+        SELECT id, title, target_amount, saved_amount, target_date, category, is_completed, created_at
+        FROM {schema}.planning
+        WHERE user_id = %s
+        ORDER BY is_completed ASC, target_date ASC
+    ''', (user_id,))
+    
+    planning = []
+    for row in cur.fetchall():
+        planning.append({
+            'id': row[0],
+            'title': row[1],
+            'targetAmount': row[2],
+            'savedAmount': row[3],
+            'targetDate': row[4],
+            'category': row[5],
+            'isCompleted': row[6],
+            'createdAt': row[7]
+        })
+    
+    summary = fetch_summary(cur, schema, user_id, year, month)
+    
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {
+        'user': {
+            'id': user[0],
+            'email': user[1],
+            'name': user[2]
+        },
+        'expenses': expenses,
+        'incomes': incomes,
+        'fixedExpenses': fixed_expenses,
+        'planning': planning,
+        'summary': summary
+    })
+
+def get_sync(user_id: int, query_params: dict) -> dict:
+    '''Отдаёт строки, созданные, изменённые или удалённые после метки клиента'''
+    since = decode_sync_watermark(query_params['since']) if query_params.get('since') else None
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    # Один снимок на все ресурсы. Новая метка — xmin этого снимка: все транзакции
+    # с меньшим номером уже завершены и видны здесь целиком, а строки транзакций
+    # от xmin и выше попадут и в следующую выдачу (клиент применяет их идемпотентно)
+    cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+    cur.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text, LOCALTIMESTAMP')
+    snapshot_xmin, snapshot_at = cur.fetchone()
+    watermark = encode_sync_watermark(snapshot_xmin, snapshot_at)
+    
+    # Без метки, со старой/чужой меткой или с меткой старше журнала удалений дельту не построить
+    if since is None or since[1] < snapshot_at - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS):
+        cur.close()
+        release_connection(conn)
+        return json_response(200, {'fullResync': True, 'watermark': watermark})
+    
+    since_xid = since[0]
+    response_body = {'fullResync': False, 'watermark': watermark}
+    
+    for name, columns, source in SYNC_RESOURCES:
+        select_columns = ', '.join(f't.{column}' for column, _ in columns)
+        cur.execute(f'''
+            SELECT {select_columns}
+            FROM {source.format(schema=schema)} AND t.sync_xid >= %s::xid8
+            LIMIT %s
+        ''', (user_id, since_xid, MAX_SYNC_ROWS + 1))
+        
+        rows = cur.fetchall()
+        if len(rows) > MAX_SYNC_ROWS:
+            cur.close()
+            release_connection(conn)
+            return json_response(200, {'fullResync': True, 'watermark': watermark})
+        
+        keys = [key for _, key in columns]
+        response_body[name] = [dict(zip(keys, row)) for row in rows]
+    
+    cur.execute(f'''
+        SELECT resource, row_id
+        FROM {schema}.deleted_rows
+        WHERE user_id = %s AND sync_xid >= %s::xid8
+        LIMIT %s
+    ''', (user_id, since_xid, MAX_SYNC_ROWS + 1))
+    
+    rows = cur.fetchall()
+    cur.close()
+    release_connection(conn)
+    
+    if len(rows) > MAX_SYNC_ROWS:
+        return json_response(200, {'fullResync': True, 'watermark': watermark})
+    
+    deleted = {name: [] for name, _, _ in SYNC_RESOURCES}
+    for resource, row_id in rows:
+        deleted.setdefault(resource, []).append(row_id)
+    response_body['deleted'] = deleted
+    
+    return json_response(200, response_body)
+
+def encode_sync_watermark(snapshot_xmin: str, snapshot_at: datetime) -> str:
+    '''Кодирует метку синхронизации: xmin снимка и его время (для проверки срока хранения tombstones)'''
+    raw = f'{snapshot_xmin}|{snapshot_at.isoformat()}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sync_watermark(watermark: str):
+    '''Разбирает метку в (xmin, время); на нераспознанной метке возвращает None, и клиент получает fullResync'''
+    try:
+        raw = base64.urlsafe_b64decode(watermark + '=' * (-len(watermark) % 4)).decode()
+        snapshot_xmin, snapshot_at = raw.split('|')
+        return str(int(snapshot_xmin)), datetime.fromisoformat(snapshot_at)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+def purge_tombstones(body: dict) -> dict:
+    '''Удаляет записи журнала удалений старше срока хранения'''
+    retention_days = int(body.get('retentionDays') or SYNC_TOMBSTONE_RETENTION_DAYS)
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    # Раньше срока хранения чистить нельзя: get_sync на него опирается
+    cur.execute(f'''
+        DELETE FROM {schema}.deleted_rows
+        WHERE deleted_at < LOCALTIMESTAMP - make_interval(days => %s)
+    ''', (max(retention_days, SYNC_TOMBSTONE_RETENTION_DAYS),))
+    
+    purged = cur.rowcount
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {'purged': purged})
+
+def get_trend(user_id: int, query_params: dict) -> dict:
+    '''Возвращает помесячные итоги доходов и расходов за последние N месяцев'''
+    current_date = datetime.now()
+    
+    try:
+        months = min(max(int(query_params.get('months', 12)), 1), MAX_TREND_MONTHS)
+    except ValueError:
+        return json_response(400, {'error': 'Invalid months'})
+    
+    # Номер месяца от начала эры: так удобно сравнивать пары (year, month)
+    last_index = current_date.year * 12 + current_date.month - 1
+    first_index = last_index - months + 1
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    cur.execute(f'''
+        SELECT year, month, kind, SUM(total_amount)
+        FROM {schema}.monthly_rollups
+        WHERE user_id = %s AND (year, month) >= (%s, %s)
+        GROUP BY year, month, kind
+    ''', (user_id, first_index // 12, first_index % 12 + 1))
+    
+    sums = {}
+    for year, month, kind, amount in cur.fetchall():
+        sums[(year, month, kind)] = amount
+    
+    cur.close()
+    release_connection(conn)
+    
+    trend = []
+    for index in range(first_index, last_index + 1):
+        year, month = index // 12, index % 12 + 1
+        income = sums.get((year, month, 'income'), Decimal(0))
+        expenses = sums.get((year, month, 'expense'), Decimal(0))
+        trend.append({
+            'year': year,
+            'month': month,
+            'income': income,
+            'expenses': expenses,
+            'balance': income - expenses
+        })
+    
+    return json_response(200, {'trend': trend})
+
+def apply_rollup_delta(cur, schema: str, user_id: int, kind: str, category: str, tx_date: date, amount_delta, count_delta: int):
+    '''Сдвигает помесячный итог в той же транзакции, что и изменение строки'''
+    cur.execute(f'''
+        INSERT INTO {schema}.monthly_rollups (user_id, year, month, category, kind, total_amount, tx_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, year, month, category, kind) DO UPDATE
+        SET total_amount = monthly_rollups.total_amount + EXCLUDED.total_amount,
+            tx_count = monthly_rollups.tx_count + EXCLUDED.tx_count,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, tx_date.year, tx_date.month, category, kind, amount_delta, count_delta))
+
+def rebuild_rollups(body: dict) -> dict:
+    '''Пересчитывает помесячные итоги из исходных таблиц, сообщает о расхождениях и при repair чинит их'''
+    repair = bool(body.get('repair'))
+    user_id = body.get('userId')
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    if repair:
+        # Блокируем итоги до чтения транзакций: параллельные вставки дождутся
+        # пересчёта и применят свои дельты уже поверх него
+        cur.execute(f'LOCK TABLE {schema}.monthly_rollups IN EXCLUSIVE MODE')
+    
+    user_filter = 'WHERE user_id = %(user_id)s' if user_id else ''
+    actual_query = f'''
+        SELECT user_id, EXTRACT(YEAR FROM date)::int AS year, EXTRACT(MONTH FROM date)::int AS month,
+               category, 'expense' AS kind, SUM(amount) AS total_amount, COUNT(*)::int AS tx_count
+        FROM {schema}.expenses {user_filter}
+        GROUP BY 1, 2, 3, 4
+        UNION ALL
+        SELECT user_id, EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int,
+               '', 'income', SUM(amount), COUNT(*)::int
+        FROM {schema}.incomes {user_filter}
+        GROUP BY 1, 2, 3
+    '''
+    
+    cur.execute(f'''
+        WITH actual AS ({actual_query}),
+        stored AS (
+            SELECT user_id, year, month, category, kind, total_amount, tx_count
+            FROM {schema}.monthly_rollups {user_filter}
+        )
+        SELECT user_id, year, month, category, kind,
+               COALESCE(a.total_amount, 0), COALESCE(s.total_amount, 0),
+               COALESCE(a.tx_count, 0), COALESCE(s.tx_count, 0)
+        FROM actual a
+        FULL OUTER JOIN stored s USING (user_id, year, month, category, kind)
+        WHERE COALESCE(a.total_amount, 0) <> COALESCE(s.total_amount, 0)
+           OR COALESCE(a.tx_count, 0) <> COALESCE(s.tx_count, 0)
+        ORDER BY user_id, year, month
+    ''', {'user_id': user_id})
+    
+    drift = []
+    for row in cur.fetchall():
+        drift.append({
+            'userId': row[0],
+            'year': row[1],
+            'month': row[2],
+            'category': row[3],
+            'kind': row[4],
+            'actualAmount': row[5],
+            'storedAmount': row[6],
+            'actualCount': row[7],
+            'storedCount': row[8]
+        })
+    
+    if repair and drift:
+        cur.execute(f'DELETE FROM {schema}.monthly_rollups {user_filter}', {'user_id': user_id})
+        cur.execute(f'''
+            INSERT INTO {schema}.monthly_rollups (user_id, year, month, category, kind, total_amount, tx_count)
+            {actual_query}
+        ''', {'user_id': user_id})
+    
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(200, {
+        'driftCount': len(drift),
+        'drift': drift[:MAX_DRIFT_REPORT],
+        'repaired': repair and bool(drift)
+    })
+
+def get_month_range(year: int, month: int) -> tuple:
+    '''Возвращает полуинтервал дат [первое число месяца, первое число следующего)'''
+    month_start = date(year, month, 1)
+    if month == 12:
+        month_end = date(year + 1, 1, 1)
+    else:
+        month_end = date(year, month + 1, 1)
+    return month_start, month_end
+
 def add_transaction(user_id: int, body: dict) -> dict:
     '''Добавляет новую транзакцию'''
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    status_code, payload = insert_transaction(cur, schema, user_id, body)
+    
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(status_code, payload)
+
+def insert_transaction(cur, schema: str, user_id: int, body: dict) -> tuple:
+    '''Вставляет транзакцию и обновляет помесячные итоги; возвращает (код, тело ответа)'''
     transaction_type = body.get('type')
     amount = body.get('amount')
     description = body.get('description', '')
     date = body.get('date', datetime.now().date().isoformat())
     
     if not transaction_type or not amount:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Missing required fields'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
-    cur = conn.cursor()
-    
-    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+        return 400, {'error': 'Missing required fields'}
     
     if transaction_type == 'income':
         cur.execute(f'''
@@ -163,11 +1030,12 @@ def add_transaction(user_id: int, body: dict) -> dict:
         ''', (user_id, amount, description, date))
         
         row = cur.fetchone()
+        apply_rollup_delta(cur, schema, user_id, 'income', '', row[3], row[1], 1)
         result = {
             'id': row[0],
-            'amount': float(row[1]),
+            'amount': row[1],
             'description': row[2],
-            'date': row[3].isoformat()
+            'date': row[3]
         }
     else:
         category = body.get('category', 'other')
@@ -178,66 +1046,465 @@ def add_transaction(user_id: int, body: dict) -> dict:
         ''', (user_id, amount, category, description, date))
         
         row = cur.fetchone()
+        apply_rollup_delta(cur, schema, user_id, 'expense', row[2], row[4], row[1], 1)
         result = {
             'id': row[0],
-            'amount': float(row[1]),
+            'amount': row[1],
             'category': row[2],
             'description': row[3],
-            'date': row[4].isoformat()
+            'date': row[4]
         }
     
+    return 201, {'transaction': result}
+
+def import_transactions(user_id: int, event: dict, query_params: dict) -> dict:
+    '''Массовый импорт транзакций из JSON-массива или CSV одной транзакцией через COPY'''
+    raw_body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        try:
+            raw_body = base64.b64decode(raw_body).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            return json_response(400, {'error': 'Invalid encoding'})
+    # Excel и Блокнот пишут BOM в начало файла: иначе он попадает в имя первой колонки CSV
+    # и мешает распознать JSON-массив
+    raw_body = raw_body.lstrip('\ufeff')
+    strict = query_params.get('strict') in ('1', 'true')
+    
+    if raw_body.lstrip().startswith('['):
+        try:
+            records = json.loads(raw_body)
+        except json.JSONDecodeError:
+            return json_response(400, {'error': 'Invalid JSON'})
+    else:
+        # CSV с заголовком: type,amount,category,description,date
+        records = csv.DictReader(io.StringIO(raw_body))
+    
+    # Строки сразу пишутся в CSV-буферы для COPY, итоги копятся для monthly_rollups
+    expense_buffer = io.StringIO()
+    income_buffer = io.StringIO()
+    expense_writer = csv.writer(expense_buffer)
+    income_writer = csv.writer(income_buffer)
+    rollup_deltas = defaultdict(lambda: [Decimal(0), 0])
+    imported = {'expense': 0, 'income': 0}
+    errors = []
+    error_count = 0
+    row_number = 0
+    
+    try:
+        for row_number, record in enumerate(records, start=1):
+            if row_number > MAX_IMPORT_ROWS:
+                return json_response(413, {'error': f'Too many rows, max {MAX_IMPORT_ROWS}'})
+            
+            try:
+                kind, amount, category, description, tx_date = parse_import_record(record)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({'row': row_number, 'error': str(e)})
+                continue
+            
+            if kind == 'income':
+                income_writer.writerow((user_id, amount, description, tx_date.isoformat()))
+            else:
+                expense_writer.writerow((user_id, amount, category, description, tx_date.isoformat()))
+            
+            delta = rollup_deltas[(kind, category, tx_date.year, tx_date.month)]
+            delta[0] += amount
+            delta[1] += 1
+            imported[kind] += 1
+    
+    except csv.Error as e:
+        # Незакрытая кавычка, NUL-байт или слишком длинное поле ломают разбор всего файла
+        return json_response(400, {'error': f'Invalid CSV at row {row_number + 1}: {e}'})
+    
+    if strict and error_count:
+        return json_response(422, {'imported': 0, 'failed': error_count, 'total': row_number, 'errors': errors})
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    if imported['expense']:
+        expense_buffer.seek(0)
+        cur.copy_expert(f'''
+            COPY {schema}.expenses (user_id, amount, category, description, date) FROM STDIN WITH (FORMAT csv)
+        ''', expense_buffer)
+    
+    if imported['income']:
+        income_buffer.seek(0)
+        cur.copy_expert(f'''
+            COPY {schema}.incomes (user_id, amount, description, date) FROM STDIN WITH (FORMAT csv)
+        ''', income_buffer)
+    
+    for (kind, category, year, month), (amount, count) in rollup_deltas.items():
+        apply_rollup_delta(cur, schema, user_id, kind, category, date(year, month, 1), amount, count)
+    
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
-    return {
-        'statusCode': 201,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'transaction': result}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {
+        'imported': imported['expense'] + imported['income'],
+        'expenses': imported['expense'],
+        'incomes': imported['income'],
+        'failed': error_count,
+        'total': row_number,
+        'errors': errors
+    })
+
+def parse_import_record(record) -> tuple:
+    '''Проверяет строку импорта и возвращает (kind, amount, category, description, date)'''
+    if not isinstance(record, dict):
+        raise ValueError('Row must be an object')
+    
+    kind = record.get('type')
+    if not isinstance(kind, str) or kind.strip() not in ('expense', 'income'):
+        raise ValueError('type must be expense or income')
+    kind = kind.strip()
+    
+    raw_amount = record.get('amount')
+    if isinstance(raw_amount, bool) or not isinstance(raw_amount, (str, int, float)):
+        raise ValueError('Invalid amount')
+    try:
+        amount = Decimal(str(raw_amount).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError('Invalid amount')
+    if not amount.is_finite() or amount <= 0 or amount >= Decimal('1e13'):
+        raise ValueError('Invalid amount')
+    amount = amount.quantize(Decimal('0.01'))
+    
+    raw_date = record.get('date')
+    if not isinstance(raw_date, str):
+        raise ValueError('date must be YYYY-MM-DD')
+    try:
+        tx_date = date.fromisoformat(raw_date.strip())
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    
+    description = parse_import_text(record.get('description'), 'description')
+    
+    if kind == 'income':
+        return kind, amount, '', description, tx_date
+    
+    category = parse_import_text(record.get('category'), 'category').strip() or 'other'
+    if len(category) > 100:
+        raise ValueError('category is too long')
+    return kind, amount, category, description, tx_date
+
+def parse_import_text(value, field: str) -> str:
+    '''Текстовое поле импорта: строка без символов, которые отвергнет COPY (NUL, непарные суррогаты)'''
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string')
+    if '\x00' in value:
+        raise ValueError(f'{field} contains a NUL character')
+    try:
+        value.encode('utf-8')
+    except UnicodeEncodeError:
+        raise ValueError(f'{field} is not valid UTF-8')
+    return value
 
 def delete_transaction(user_id: int, query_params: dict) -> dict:
     '''Удаляет транзакцию'''
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    status_code, payload = remove_transaction(cur, schema, user_id, query_params)
+    
+    conn.commit()
+    cur.close()
+    release_connection(conn)
+    
+    return json_response(status_code, payload)
+
+def remove_transaction(cur, schema: str, user_id: int, query_params: dict) -> tuple:
+    '''Удаляет транзакцию и откатывает её вклад в итоги; возвращает (код, тело ответа)'''
     transaction_id = query_params.get('id')
     transaction_type = query_params.get('type')
     
     if not transaction_id or not transaction_type:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Missing transaction id or type'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
-    cur = conn.cursor()
+        return 400, {'error': 'Missing transaction id or type'}
     
-    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-    
-    table = 'incomes' if transaction_type == 'income' else 'expenses'
+    if transaction_type == 'income':
+        table = 'incomes'
+        kind = 'income'
+        category_column = "''"
+    else:
+        table = 'expenses'
+        kind = 'expense'
+        category_column = 'category'
     
     cur.execute(f'''
         DELETE FROM {schema}.{table}
         WHERE id = %s AND user_id = %s
+        RETURNING amount, {category_column}, date
     ''', (transaction_id, user_id))
     
-    conn.commit()
-    deleted = cur.rowcount > 0
+    row = cur.fetchone()
+    if not row:
+        return 404, {'error': 'Transaction not found'}
+    
+    apply_rollup_delta(cur, schema, user_id, kind, row[1], row[2], -row[0], -1)
+    return 200, {'success': True}
+
+def run_batch(user_id: int, body: dict) -> dict:
+    '''Выполняет упорядоченный список операций над транзакциями и фиксированными/планами в одной транзакции БД'''
+    import psycopg2
+    
+    operations = body.get('operations')
+    atomic = bool(body.get('atomic'))
+    
+    if not isinstance(operations, list) or not operations:
+        return json_response(400, {'error': 'Missing operations'})
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return json_response(413, {'error': f'Too many operations, max {MAX_BATCH_OPERATIONS}'})
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    
+    results = []
+    failed = False
+    
+    for index, operation in enumerate(operations):
+        # Точка сохранения на операцию: ошибка откатывает только её, остальное уходит одним коммитом
+        cur.execute('SAVEPOINT batch_operation')
+        try:
+            status_code, payload = dispatch_batch_operation(cur, schema, user_id, operation)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            status_code, payload = 400, {'error': e.pgerror.strip() if e.pgerror else 'Invalid operation'}
+        except psycopg2.Error:
+            # Например, ProgrammingError «can't adapt type 'dict'» на объекте вместо числа
+            status_code, payload = 400, {'error': 'Invalid operation'}
+        except (AttributeError, KeyError, TypeError):
+            status_code, payload = 400, {'error': 'Invalid operation'}
+        
+        if status_code >= 400:
+            cur.execute('ROLLBACK TO SAVEPOINT batch_operation')
+            failed = True
+        else:
+            cur.execute('RELEASE SAVEPOINT batch_operation')
+        
+        results.append({'index': index, 'status': status_code, **payload})
+        
+        if failed and atomic:
+            break
+    
+    committed = not (failed and atomic)
+    if committed:
+        conn.commit()
+    else:
+        conn.rollback()
+    
     cur.close()
-    conn.close()
-    
-    if deleted:
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+    release_connection(conn)
+    
+    return json_response(200 if committed else 409, {'committed': committed, 'results': results})
+
+def dispatch_batch_operation(cur, schema: str, user_id: int, operation: dict) -> tuple:
+    '''Направляет операцию пакета туда же, куда её отправил бы одиночный запрос к соответствующей функции'''
+    target = operation.get('target')
+    method = operation.get('method')
+    body = operation.get('body') or {}
+    params = operation.get('params') or {}
+    
+    if target == 'transactions':
+        if method == 'POST':
+            return insert_transaction(cur, schema, user_id, body)
+        if method == 'DELETE':
+            return remove_transaction(cur, schema, user_id, params)
+    
+    if target == 'fixed-planning':
+        if method == 'POST':
+            return insert_item(cur, schema, user_id, body)
+        if method == 'PUT' and 'depositId' in body:
+            return modify_deposit(cur, schema, user_id, body)
+        if method == 'PUT':
+            return modify_item(cur, schema, user_id, body)
+        if method == 'DELETE' and 'depositId' in params:
+            return remove_deposit(cur, schema, user_id, params)
+        if method == 'DELETE':
+            return remove_item(cur, schema, user_id, params)
+    
+    return 400, {'error': 'Unknown operation'}
+
+# Операции фиксированных расходов и целей для пакета повторяют backend/fixed-planning:
+# функции деплоятся по отдельности, общий модуль между ними не разделить
+
+def fixed_row_to_dict(row) -> dict:
+    '''Строка fixed_expenses в формате ответа fixed-planning'''
+    return {
+        'id': row[0],
+        'title': row[1],
+        'amount': row[2],
+        'category': row[3],
+        'dayOfMonth': row[4],
+        'isActive': row[5],
+        'createdAt': row[6]
+    }
+
+def planning_row_to_dict(row) -> dict:
+    '''Строка planning в формате ответа fixed-planning'''
+    return {
+        'id': row[0],
+        'title': row[1],
+        'targetAmount': row[2],
+        'savedAmount': row[3],
+        'targetDate': row[4],
+        'category': row[5],
+        'isCompleted': row[6],
+        'createdAt': row[7]
+    }
+
+def insert_item(cur, schema: str, user_id: int, body: dict) -> tuple:
+    '''Добавляет фиксированный расход или цель'''
+    resource_type = body.get('type')
+    
+    if resource_type == 'fixed':
+        if not all([body.get('title'), body.get('amount'), body.get('category'), body.get('dayOfMonth')]):
+            return 400, {'error': 'Missing required fields'}
+        
+        cur.execute(f'''
+            INSERT INTO {schema}.fixed_expenses (user_id, title, amount, category, day_of_month)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING {FIXED_COLUMNS}
+        ''', (user_id, body['title'], body['amount'], body['category'], body['dayOfMonth']))
+        return 201, {'item': fixed_row_to_dict(cur.fetchone())}
+    
+    if resource_type == 'planning':
+        if not all([body.get('title'), body.get('targetAmount'), body.get('category')]):
+            return 400, {'error': 'Missing required fields'}
+        
+        cur.execute(f'''
+            INSERT INTO {schema}.planning (user_id, title, target_amount, category, target_date)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING {PLANNING_COLUMNS}
+        ''', (user_id, body['title'], body['targetAmount'], body['category'], body.get('targetDate')))
+        return 201, {'item': planning_row_to_dict(cur.fetchone())}
+    
+    return 400, {'error': 'Invalid type'}
+
+def modify_item(cur, schema: str, user_id: int, body: dict) -> tuple:
+    '''Обновляет фиксированный расход или цель'''
+    resource_type = body.get('type')
+    item_id = body.get('id')
+    
+    if not item_id:
+        return 400, {'error': 'Missing item id'}
+    
+    if resource_type == 'fixed':
+        cur.execute(f'''
+            UPDATE {schema}.fixed_expenses
+            SET is_active = %s
+            WHERE id = %s AND user_id = %s
+            RETURNING {FIXED_COLUMNS}
+        ''', (body.get('isActive'), item_id, user_id))
+        row = cur.fetchone()
+        return (200, {'item': fixed_row_to_dict(row)}) if row else (404, {'error': 'Item not found'})
+    
+    if resource_type != 'planning':
+        return 400, {'error': 'Invalid type'}
+    
+    if 'addAmount' in body:
+        # Пополнение пишется только если цель принадлежит пользователю
+        cur.execute(f'''
+            WITH goal AS (
+                UPDATE {schema}.planning
+                SET saved_amount = saved_amount + %(amount)s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %(id)s AND user_id = %(user_id)s
+                RETURNING {PLANNING_COLUMNS}
+            ), deposit AS (
+                INSERT INTO {schema}.planning_deposits (planning_id, amount, comment)
+                SELECT id, %(amount)s, %(comment)s FROM goal
+            )
+            SELECT * FROM goal
+        ''', {'amount': body['addAmount'], 'comment': body.get('comment', ''), 'id': item_id, 'user_id': user_id})
+    elif 'isCompleted' in body:
+        cur.execute(f'''
+            UPDATE {schema}.planning
+            SET is_completed = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND user_id = %s
+            RETURNING {PLANNING_COLUMNS}
+        ''', (body['isCompleted'], item_id, user_id))
     else:
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Transaction not found'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return 400, {'error': 'No fields to update'}
+    
+    row = cur.fetchone()
+    return (200, {'item': planning_row_to_dict(row)}) if row else (404, {'error': 'Item not found'})
+
+def remove_item(cur, schema: str, user_id: int, query_params: dict) -> tuple:
+    '''Удаляет фиксированный расход или цель вместе с её пополнениями'''
+    item_id = query_params.get('id')
+    resource_type = query_params.get('type')
+    
+    if not item_id or not resource_type:
+        return 400, {'error': 'Missing id or type'}
+    
+    table = 'fixed_expenses' if resource_type == 'fixed' else 'planning'
+    
+    if resource_type == 'planning':
+        cur.execute(f'''
+            DELETE FROM {schema}.planning_deposits pd
+            USING {schema}.planning p
+            WHERE pd.planning_id = p.id AND p.id = %s AND p.user_id = %s
+        ''', (item_id, user_id))
+    
+    cur.execute(f'''
+        DELETE FROM {schema}.{table}
+        WHERE id = %s AND user_id = %s
+    ''', (item_id, user_id))
+    
+    return (200, {'success': True}) if cur.rowcount > 0 else (404, {'error': 'Item not found'})
+
+def modify_deposit(cur, schema: str, user_id: int, body: dict) -> tuple:
+    '''Меняет сумму и комментарий пополнения и сдвигает накопленное цели на разницу одним оператором'''
+    cur.execute(f'''
+        WITH old AS (
+            SELECT pd.id, pd.planning_id, pd.amount
+            FROM {schema}.planning_deposits pd
+            JOIN {schema}.planning p ON pd.planning_id = p.id
+            WHERE pd.id = %(deposit_id)s AND p.id = %(planning_id)s AND p.user_id = %(user_id)s
+            FOR UPDATE OF pd
+        ), updated AS (
+            UPDATE {schema}.planning_deposits pd
+            SET amount = %(amount)s, comment = %(comment)s, updated_at = CURRENT_TIMESTAMP
+            FROM old
+            WHERE pd.id = old.id
+            RETURNING pd.planning_id, pd.amount - old.amount AS diff
+        )
+        UPDATE {schema}.planning p
+        SET saved_amount = p.saved_amount + updated.diff, updated_at = CURRENT_TIMESTAMP
+        FROM updated
+        WHERE p.id = updated.planning_id
+        RETURNING p.id
+    ''', {'deposit_id': body['depositId'], 'planning_id': body['planningId'], 'user_id': user_id,
+          'amount': body['amount'], 'comment': body.get('comment', '')})
+    
+    return (200, {'success': True}) if cur.fetchone() else (404, {'error': 'Deposit not found'})
+
+def remove_deposit(cur, schema: str, user_id: int, query_params: dict) -> tuple:
+    '''Удаляет пополнение и вычитает его из накопленного цели одним оператором'''
+    deposit_id = query_params.get('depositId')
+    planning_id = query_params.get('id')
+    
+    if not deposit_id or not planning_id:
+        return 400, {'error': 'Missing depositId or id'}
+    
+    cur.execute(f'''
+        WITH removed AS (
+            DELETE FROM {schema}.planning_deposits pd
+            USING {schema}.planning p
+            WHERE pd.planning_id = p.id AND pd.id = %(deposit_id)s AND p.id = %(planning_id)s AND p.user_id = %(user_id)s
+            RETURNING pd.planning_id, pd.amount
+        )
+        UPDATE {schema}.planning p
+        SET saved_amount = p.saved_amount - removed.amount, updated_at = CURRENT_TIMESTAMP
+        FROM removed
+        WHERE p.id = removed.planning_id
+        RETURNING p.id
+    ''', {'deposit_id': deposit_id, 'planning_id': planning_id, 'user_id': user_id})
+    
+    return (200, {'success': True}) if cur.fetchone() else (404, {'error': 'Deposit not found'})
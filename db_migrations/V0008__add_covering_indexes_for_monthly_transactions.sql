@@ -0,0 +1,14 @@
+-- Покрывающие индексы для выборки транзакций за месяц: запрос
+-- WHERE user_id = ? AND date >= ? AND date < ? ORDER BY date DESC
+-- выполняется как index-only scan без обращения к таблице
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_covering
+ON t_p6400114_finance_tracker_mobi.expenses(user_id, date DESC)
+INCLUDE (id, amount, category, description);
+
+CREATE INDEX IF NOT EXISTS idx_incomes_user_date_covering
+ON t_p6400114_finance_tracker_mobi.incomes(user_id, date DESC)
+INCLUDE (id, amount, description);
+
+-- Старые индексы (user_id, date) полностью перекрываются новыми
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_expenses_user_date;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_incomes_user_date;
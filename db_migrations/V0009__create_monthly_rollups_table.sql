@@ -0,0 +1,23 @@
+-- Помесячные итоги по пользователю и категории, обновляются вместе с транзакциями
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.monthly_rollups (
+    user_id INTEGER NOT NULL REFERENCES t_p6400114_finance_tracker_mobi.users(id),
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    category VARCHAR(100) NOT NULL DEFAULT '',
+    kind VARCHAR(10) NOT NULL CHECK (kind IN ('expense', 'income')),
+    total_amount NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    tx_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, year, month, category, kind)
+);
+
+-- Первичное заполнение из существующих транзакций (у доходов категории нет)
+INSERT INTO t_p6400114_finance_tracker_mobi.monthly_rollups (user_id, year, month, category, kind, total_amount, tx_count)
+SELECT user_id, EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int, category, 'expense', SUM(amount), COUNT(*)
+FROM t_p6400114_finance_tracker_mobi.expenses
+GROUP BY 1, 2, 3, 4
+UNION ALL
+SELECT user_id, EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int, '', 'income', SUM(amount), COUNT(*)
+FROM t_p6400114_finance_tracker_mobi.incomes
+GROUP BY 1, 2, 3
+ON CONFLICT (user_id, year, month, category, kind) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Контрольные точки пакетного создания автоплатежей для всех пользователей
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.auto_expense_runs (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    users_processed INTEGER NOT NULL DEFAULT 0,
+    expenses_created INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    PRIMARY KEY (year, month)
+);
+
+-- Поиск пользователей с активными фиксированными платежами
+CREATE INDEX IF NOT EXISTS idx_fixed_expenses_active_user_id
+ON t_p6400114_finance_tracker_mobi.fixed_expenses(user_id) WHERE is_active = TRUE;
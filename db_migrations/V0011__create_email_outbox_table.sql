@@ -0,0 +1,18 @@
+-- Очередь исходящих писем: запрос только ставит письмо в очередь, отправляет фоновый обработчик
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.email_outbox (
+    id SERIAL PRIMARY KEY,
+    to_email VARCHAR(255) NOT NULL,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed', 'expired')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Выборка писем, готовых к отправке
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending
+ON t_p6400114_finance_tracker_mobi.email_outbox(next_attempt_at) WHERE status = 'pending';
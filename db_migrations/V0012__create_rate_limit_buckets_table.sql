@@ -0,0 +1,10 @@
+-- Токен-бакеты для ограничения частоты запросов (send_code по email и IP)
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.rate_limit_buckets (
+    bucket_key VARCHAR(320) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Очистка давно не использованных бакетов
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at
+ON t_p6400114_finance_tracker_mobi.rate_limit_buckets(updated_at);
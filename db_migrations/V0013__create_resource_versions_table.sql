@@ -0,0 +1,67 @@
+-- Счётчики изменений по пользователю и ресурсу для ETag / условных GET
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.resource_versions (
+    user_id INTEGER NOT NULL REFERENCES t_p6400114_finance_tracker_mobi.users(id),
+    resource VARCHAR(20) NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, resource)
+);
+
+-- Один инкремент на пользователя за оператор, даже при массовой вставке
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p6400114_finance_tracker_mobi.resource_versions (user_id, resource, version)
+    SELECT DISTINCT user_id, TG_ARGV[0], 1 FROM changed_rows
+    ON CONFLICT (user_id, resource) DO UPDATE
+    SET version = resource_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- У пополнений нет user_id: берём владельца цели
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.bump_planning_version_from_deposits() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p6400114_finance_tracker_mobi.resource_versions (user_id, resource, version)
+    SELECT DISTINCT p.user_id, 'planning', 1
+    FROM changed_rows c
+    JOIN t_p6400114_finance_tracker_mobi.planning p ON p.id = c.planning_id
+    ON CONFLICT (user_id, resource) DO UPDATE
+    SET version = resource_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_expenses_version_insert AFTER INSERT ON t_p6400114_finance_tracker_mobi.expenses
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('expenses');
+CREATE TRIGGER trg_expenses_version_update AFTER UPDATE ON t_p6400114_finance_tracker_mobi.expenses
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('expenses');
+CREATE TRIGGER trg_expenses_version_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.expenses
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('expenses');
+
+CREATE TRIGGER trg_incomes_version_insert AFTER INSERT ON t_p6400114_finance_tracker_mobi.incomes
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('incomes');
+CREATE TRIGGER trg_incomes_version_update AFTER UPDATE ON t_p6400114_finance_tracker_mobi.incomes
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('incomes');
+CREATE TRIGGER trg_incomes_version_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.incomes
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('incomes');
+
+CREATE TRIGGER trg_fixed_expenses_version_insert AFTER INSERT ON t_p6400114_finance_tracker_mobi.fixed_expenses
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('fixed');
+CREATE TRIGGER trg_fixed_expenses_version_update AFTER UPDATE ON t_p6400114_finance_tracker_mobi.fixed_expenses
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('fixed');
+CREATE TRIGGER trg_fixed_expenses_version_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.fixed_expenses
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('fixed');
+
+CREATE TRIGGER trg_planning_version_insert AFTER INSERT ON t_p6400114_finance_tracker_mobi.planning
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('planning');
+CREATE TRIGGER trg_planning_version_update AFTER UPDATE ON t_p6400114_finance_tracker_mobi.planning
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('planning');
+CREATE TRIGGER trg_planning_version_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.planning
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_resource_version('planning');
+
+CREATE TRIGGER trg_planning_deposits_version_insert AFTER INSERT ON t_p6400114_finance_tracker_mobi.planning_deposits
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_planning_version_from_deposits();
+CREATE TRIGGER trg_planning_deposits_version_update AFTER UPDATE ON t_p6400114_finance_tracker_mobi.planning_deposits
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_planning_version_from_deposits();
+CREATE TRIGGER trg_planning_deposits_version_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.planning_deposits
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.bump_planning_version_from_deposits();
@@ -0,0 +1,77 @@
+-- Колонки updated_at для дельта-синхронизации (у planning и planning_deposits уже есть)
+ALTER TABLE t_p6400114_finance_tracker_mobi.incomes
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE t_p6400114_finance_tracker_mobi.expenses
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE t_p6400114_finance_tracker_mobi.fixed_expenses
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- updated_at проставляет база, чтобы ни один путь записи его не пропустил
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_incomes_touch BEFORE INSERT OR UPDATE ON t_p6400114_finance_tracker_mobi.incomes
+FOR EACH ROW EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at();
+CREATE TRIGGER trg_expenses_touch BEFORE INSERT OR UPDATE ON t_p6400114_finance_tracker_mobi.expenses
+FOR EACH ROW EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at();
+CREATE TRIGGER trg_fixed_expenses_touch BEFORE INSERT OR UPDATE ON t_p6400114_finance_tracker_mobi.fixed_expenses
+FOR EACH ROW EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at();
+CREATE TRIGGER trg_planning_touch BEFORE INSERT OR UPDATE ON t_p6400114_finance_tracker_mobi.planning
+FOR EACH ROW EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at();
+CREATE TRIGGER trg_planning_deposits_touch BEFORE INSERT OR UPDATE ON t_p6400114_finance_tracker_mobi.planning_deposits
+FOR EACH ROW EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at();
+
+-- Индексы под выборку изменений пользователя после метки времени
+CREATE INDEX IF NOT EXISTS idx_incomes_user_updated ON t_p6400114_finance_tracker_mobi.incomes(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_updated ON t_p6400114_finance_tracker_mobi.expenses(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_fixed_expenses_user_updated ON t_p6400114_finance_tracker_mobi.fixed_expenses(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_planning_user_updated ON t_p6400114_finance_tracker_mobi.planning(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_planning_deposits_planning_updated ON t_p6400114_finance_tracker_mobi.planning_deposits(planning_id, updated_at);
+
+-- Журнал удалений (tombstones) для синхронизации
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.deleted_rows (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    resource VARCHAR(20) NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_user_deleted ON t_p6400114_finance_tracker_mobi.deleted_rows(user_id, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_deleted_at ON t_p6400114_finance_tracker_mobi.deleted_rows(deleted_at);
+
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_rows() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p6400114_finance_tracker_mobi.deleted_rows (user_id, resource, row_id)
+    SELECT user_id, TG_ARGV[0], id FROM deleted;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пополнения удаляются до самой цели, поэтому владелец ещё находится через planning
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_deposits() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p6400114_finance_tracker_mobi.deleted_rows (user_id, resource, row_id)
+    SELECT p.user_id, 'deposits', d.id
+    FROM deleted d
+    JOIN t_p6400114_finance_tracker_mobi.planning p ON p.id = d.planning_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_incomes_log_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.incomes
+REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_rows('incomes');
+CREATE TRIGGER trg_expenses_log_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.expenses
+REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_rows('expenses');
+CREATE TRIGGER trg_fixed_expenses_log_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.fixed_expenses
+REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_rows('fixed');
+CREATE TRIGGER trg_planning_log_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.planning
+REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_rows('planning');
+CREATE TRIGGER trg_planning_deposits_log_delete AFTER DELETE ON t_p6400114_finance_tracker_mobi.planning_deposits
+REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION t_p6400114_finance_tracker_mobi.log_deleted_deposits();
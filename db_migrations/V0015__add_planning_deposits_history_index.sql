@@ -0,0 +1,6 @@
+-- Постраничная история пополнений цели: keyset по (created_at, id) от новых к старым
+CREATE INDEX IF NOT EXISTS idx_planning_deposits_planning_created
+ON t_p6400114_finance_tracker_mobi.planning_deposits(planning_id, created_at DESC, id DESC);
+
+-- Поиск по planning_id покрывается новым индексом
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_planning_deposits_planning_id;
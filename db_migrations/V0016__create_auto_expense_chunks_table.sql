@@ -0,0 +1,16 @@
+-- Заявленные диапазоны пользователей пакетного запуска автоплатежей.
+-- last_user_id в auto_expense_runs — граница выданных диапазонов, а не обработанных:
+-- диапазон считается сделанным только по completed_at своей строки здесь
+CREATE TABLE IF NOT EXISTS t_p6400114_finance_tracker_mobi.auto_expense_chunks (
+    id SERIAL PRIMARY KEY,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    after_user_id INTEGER NOT NULL,
+    last_user_id INTEGER NOT NULL,
+    claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    FOREIGN KEY (year, month) REFERENCES t_p6400114_finance_tracker_mobi.auto_expense_runs(year, month) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_auto_expense_chunks_unfinished
+ON t_p6400114_finance_tracker_mobi.auto_expense_chunks(year, month, id) WHERE completed_at IS NULL;
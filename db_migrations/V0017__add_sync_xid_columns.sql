@@ -0,0 +1,32 @@
+-- Дельта-синхронизация по номеру транзакции записи вместо времени записи:
+-- updated_at ставится в момент записи, а не коммита, и долгая транзакция
+-- могла закоммитить строки «в прошлое», мимо уже выданной метки
+ALTER TABLE t_p6400114_finance_tracker_mobi.incomes ADD COLUMN IF NOT EXISTS sync_xid xid8;
+ALTER TABLE t_p6400114_finance_tracker_mobi.expenses ADD COLUMN IF NOT EXISTS sync_xid xid8;
+ALTER TABLE t_p6400114_finance_tracker_mobi.fixed_expenses ADD COLUMN IF NOT EXISTS sync_xid xid8;
+ALTER TABLE t_p6400114_finance_tracker_mobi.planning ADD COLUMN IF NOT EXISTS sync_xid xid8;
+ALTER TABLE t_p6400114_finance_tracker_mobi.planning_deposits ADD COLUMN IF NOT EXISTS sync_xid xid8;
+ALTER TABLE t_p6400114_finance_tracker_mobi.deleted_rows ADD COLUMN IF NOT EXISTS sync_xid xid8 DEFAULT pg_current_xact_id();
+
+CREATE OR REPLACE FUNCTION t_p6400114_finance_tracker_mobi.touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp();
+    NEW.sync_xid = pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE INDEX IF NOT EXISTS idx_incomes_user_sync_xid ON t_p6400114_finance_tracker_mobi.incomes(user_id, sync_xid);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_sync_xid ON t_p6400114_finance_tracker_mobi.expenses(user_id, sync_xid);
+CREATE INDEX IF NOT EXISTS idx_fixed_expenses_user_sync_xid ON t_p6400114_finance_tracker_mobi.fixed_expenses(user_id, sync_xid);
+CREATE INDEX IF NOT EXISTS idx_planning_user_sync_xid ON t_p6400114_finance_tracker_mobi.planning(user_id, sync_xid);
+CREATE INDEX IF NOT EXISTS idx_planning_deposits_planning_sync_xid ON t_p6400114_finance_tracker_mobi.planning_deposits(planning_id, sync_xid);
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_user_sync_xid ON t_p6400114_finance_tracker_mobi.deleted_rows(user_id, sync_xid);
+
+-- Выборка по updated_at больше не используется
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_incomes_user_updated;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_expenses_user_updated;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_fixed_expenses_user_updated;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_planning_user_updated;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_planning_deposits_planning_updated;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_deleted_rows_user_deleted;
@@ -0,0 +1,13 @@
+-- description — неограниченный TEXT: в листьях B-tree длинное описание не помещается
+-- («index row size exceeds btree maximum») и ломает вставку и COPY-импорт.
+-- Сводкам хватает (user_id, date) + amount/category, список дочитывает description из таблицы
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_amount
+ON t_p6400114_finance_tracker_mobi.expenses(user_id, date DESC)
+INCLUDE (id, amount, category);
+
+CREATE INDEX IF NOT EXISTS idx_incomes_user_date_amount
+ON t_p6400114_finance_tracker_mobi.incomes(user_id, date DESC)
+INCLUDE (id, amount);
+
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_expenses_user_date_covering;
+DROP INDEX IF EXISTS t_p6400114_finance_tracker_mobi.idx_incomes_user_date_covering;
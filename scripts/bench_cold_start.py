@@ -0,0 +1,91 @@
+'''Бенчмарк холодного старта функций: время импорта index.py, ответа на OPTIONS и на запрос без токена
+в свежем процессе, плюс какие тяжёлые модули (psycopg2, jwt, smtplib) при этом загрузились и сколько
+стоил бы их импорт на верхнем уровне модуля, как было раньше.
+
+Запуск (база не нужна):
+    python scripts/bench_cold_start.py --repeat 15
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+FUNCTIONS = ['auth', 'auto-expenses', 'fixed-planning', 'transactions']
+HEAVY_MODULES = ['psycopg2', 'jwt', 'smtplib', 'email.mime.multipart']
+
+# Выполняется в отдельном интерпретаторе: один процесс — один холодный старт
+PROBE = '''
+import importlib, importlib.util, json, sys, time
+path, heavy = sys.argv[1], sys.argv[2].split(',')
+
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('index', path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+options = module.handler({'httpMethod': 'OPTIONS', 'headers': {}}, None)
+answered = time.perf_counter()
+unauthorized = module.handler({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {}}, None)
+rejected = time.perf_counter()
+
+loaded = [name for name in heavy if name in sys.modules]
+eager = 0.0
+for name in heavy:
+    if name in sys.modules:
+        continue
+    before = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        continue
+    eager += time.perf_counter() - before
+
+print(json.dumps({
+    'importMs': (imported - started) * 1000,
+    'optionsMs': (answered - imported) * 1000,
+    'optionsStatus': options['statusCode'],
+    'unauthorizedMs': (rejected - answered) * 1000,
+    'unauthorizedStatus': unauthorized['statusCode'],
+    'heavyLoaded': loaded,
+    'eagerImportMs': eager * 1000
+}))
+'''
+
+
+def probe(function: str) -> dict:
+    '''Один холодный старт функции в свежем интерпретаторе'''
+    path = os.path.join(BACKEND_DIR, function, 'index.py')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, path, ','.join(HEAVY_MODULES)],
+        check=True, capture_output=True, text=True, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    ).stdout
+    return json.loads(output)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=15)
+    args = parser.parse_args()
+
+    report = {}
+    for function in FUNCTIONS:
+        samples = [probe(function) for _ in range(args.repeat)]
+        report[function] = {
+            'importMs': round(statistics.median(s['importMs'] for s in samples), 2),
+            'optionsMs': round(statistics.median(s['optionsMs'] for s in samples), 3),
+            'optionsStatus': samples[0]['optionsStatus'],
+            'unauthorizedMs': round(statistics.median(s['unauthorizedMs'] for s in samples), 3),
+            'unauthorizedStatus': samples[0]['unauthorizedStatus'],
+            'heavyLoaded': samples[0]['heavyLoaded'],
+            'avoidedImportMs': round(statistics.median(s['eagerImportMs'] for s in samples), 2)
+        }
+
+    print(json.dumps(report, indent=2))
+    return 1 if any(entry['heavyLoaded'] for entry in report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+'''Микробенчмарк кодирования ответа: поэлементные float()/isoformat() + json.dumps против
+передачи строк БД как есть в encode_json (orjson, если установлен, и стандартный json).
+
+Запуск (база не нужна, psycopg2 не импортируется):
+    python scripts/bench_json_encoding.py --rows 10000 --repeat 20
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'backend', 'transactions', 'index.py')
+
+
+def load_handler_module():
+    '''Загружает index.py функции transactions'''
+    spec = importlib.util.spec_from_file_location('transactions_index', INDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_rows(count: int) -> list:
+    '''Строки в форме выборки get_transactions: (id, amount, category, description, date)'''
+    rng = random.Random(0)
+    today = date.today()
+    return [
+        (index, Decimal(rng.randint(1, 10000000)) / 100, rng.choice(['food', 'transport', 'home', 'other']),
+         f'expense {index}', today - timedelta(days=rng.randint(0, 365)))
+        for index in range(count, 0, -1)
+    ]
+
+
+def encode_legacy(rows: list) -> str:
+    '''Прежний путь: каждое поле приводится вручную, затем json.dumps'''
+    return json.dumps({'transactions': [
+        {'id': row[0], 'amount': float(row[1]), 'category': row[2], 'description': row[3], 'date': row[4].isoformat()}
+        for row in rows
+    ]})
+
+
+def build_payload(rows: list) -> dict:
+    '''Текущий путь get_transactions: значения БД передаются кодировщику без преобразований'''
+    return {'transactions': [
+        {'id': row[0], 'amount': row[1], 'category': row[2], 'description': row[3], 'date': row[4]}
+        for row in rows
+    ]}
+
+
+def best_of(func, repeat: int) -> float:
+    '''Лучшее время из repeat прогонов в мс'''
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        func()
+        timings.append((time.process_time() - started) * 1000)
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    module = load_handler_module()
+    rows = make_rows(args.rows)
+    stdlib_encode = lambda: json.dumps(build_payload(rows), default=module.json_default)
+
+    # Все варианты обязаны давать одинаковый JSON после разбора
+    expected = json.loads(encode_legacy(rows))
+    if json.loads(module.encode_json(build_payload(rows))) != expected or json.loads(stdlib_encode()) != expected:
+        print('encoded payloads differ', file=sys.stderr)
+        return 1
+
+    legacy = best_of(lambda: encode_legacy(rows), args.repeat)
+    current = best_of(lambda: module.encode_json(build_payload(rows)), args.repeat)
+    fallback = best_of(stdlib_encode, args.repeat)
+
+    print(json.dumps({
+        'rows': args.rows,
+        'orjson': module.orjson is not None,
+        'legacyMs': round(legacy, 2),
+        'encodeJsonMs': round(current, 2),
+        'stdlibFallbackMs': round(fallback, 2),
+        'savedPerResponseMs': round(legacy - current, 2)
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+'''Бенчмарк выборки транзакций за месяц: фильтр EXTRACT(YEAR/MONTH FROM date) против
+полуинтервала дат по индексу (user_id, date DESC) на пользователе со 100k расходов.
+
+Запуск (схема с применёнными миграциями):
+    DATABASE_URL=postgresql://localhost/finance MAIN_DB_SCHEMA=t_p6400114_finance_tracker_mobi \
+        python scripts/bench_month_range.py --rows 100000 --repeat 20
+Тестовый пользователь и его строки удаляются в конце.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import date
+
+import psycopg2
+
+EXTRACT_QUERY = '''
+    SELECT id, amount, category, description, date
+    FROM {schema}.expenses
+    WHERE user_id = %s AND EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
+    ORDER BY date DESC
+'''
+
+RANGE_QUERY = '''
+    SELECT id, amount, category, description, date
+    FROM {schema}.expenses
+    WHERE user_id = %s AND date >= %s AND date < %s
+    ORDER BY date DESC, id DESC
+'''
+
+
+def seed(cur, schema: str, rows: int) -> int:
+    '''Создаёт пользователя с rows расходами, равномерно разложенными по последним ~8 годам'''
+    cur.execute(f'''
+        INSERT INTO {schema}.users (google_id, email, name)
+        VALUES (%s, %s, 'bench') RETURNING id
+    ''', (f'bench-{uuid.uuid4()}', f'bench-{uuid.uuid4()}@example.com'))
+    user_id = cur.fetchone()[0]
+
+    cur.execute(f'''
+        INSERT INTO {schema}.expenses (user_id, amount, category, description, date)
+        SELECT %s, (random() * 5000)::numeric(15, 2), 'food', 'bench row ' || n,
+               CURRENT_DATE - (n %% 3000)
+        FROM generate_series(1, %s) AS n
+    ''', (user_id, rows))
+    cur.execute(f'ANALYZE {schema}.expenses')
+    return user_id
+
+
+def measure(cur, query: str, params: tuple, repeat: int) -> dict:
+    '''Медиана и p95 времени выполнения в мс плюс план последнего прогона'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) ' + query, params)
+    plan = [row[0] for row in cur.fetchall()]
+    timings.sort()
+    return {
+        'medianMs': round(statistics.median(timings), 2),
+        'p95Ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+        'plan': plan
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    user_id = seed(cur, schema, args.rows)
+    conn.commit()
+
+    try:
+        today = date.today()
+        month_start = today.replace(day=1)
+        month_end = date(today.year + (today.month == 12), today.month % 12 + 1, 1)
+
+        result = {
+            'rows': args.rows,
+            'extract': measure(cur, EXTRACT_QUERY.format(schema=schema), (user_id, today.year, today.month), args.repeat),
+            'range': measure(cur, RANGE_QUERY.format(schema=schema), (user_id, month_start, month_end), args.repeat)
+        }
+        result['speedup'] = round(result['extract']['medianMs'] / max(result['range']['medianMs'], 0.001), 1)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    finally:
+        conn.rollback()
+        cur.execute(f'DELETE FROM {schema}.expenses WHERE user_id = %s', (user_id,))
+        cur.execute(f'DELETE FROM {schema}.users WHERE id = %s', (user_id,))
+        conn.commit()
+        conn.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+'''Проверка очереди писем против локального SMTP (aiosmtpd) и локальной Postgres: deliver_outbox
+отправляет письма, повторяет временные отказы сервера, помечает истёкшие и стирает текст с кодом
+у отработанных строк.
+
+Запуск (схема с применёнными миграциями, pip install aiosmtpd):
+    DATABASE_URL=postgresql://localhost/finance MAIN_DB_SCHEMA=t_p6400114_finance_tracker_mobi \
+        python scripts/check_outbox_delivery.py --messages 20 --fail-first 3
+deliver_outbox разбирает всю очередь схемы, поэтому запускать стоит на тестовой базе.
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import psycopg2
+from aiosmtpd.controller import Controller
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'backend', 'auth', 'index.py')
+
+
+class RecordingHandler:
+    '''Принимает письма, отвечая временной ошибкой на первые fail_first попыток'''
+
+    def __init__(self, fail_first: int):
+        self.fail_first = fail_first
+        self.rejected = 0
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.rejected < self.fail_first:
+            self.rejected += 1
+            return '451 Temporary failure, try again later'
+        self.received.append((envelope.rcpt_tos, envelope.content.decode('utf-8', 'replace')))
+        return '250 OK'
+
+
+def load_handler_module():
+    '''Загружает index.py функции auth'''
+    spec = importlib.util.spec_from_file_location('auth_index', INDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed(cur, schema: str, module, messages: int) -> tuple:
+    '''Ставит в очередь messages живых писем и одно с истёкшим кодом; возвращает {id: (email, code)} и id истёкшего'''
+    queued = {}
+    for _ in range(messages):
+        email = f'outbox-{uuid.uuid4()}@example.com'
+        code = f'{random.randint(0, 999999):06d}'
+        subject, html = module.build_code_email(code)
+        cur.execute(f'''
+            INSERT INTO {schema}.email_outbox (to_email, subject, html, expires_at)
+            VALUES (%s, %s, %s, %s) RETURNING id
+        ''', (email, subject, html, datetime.utcnow() + timedelta(minutes=10)))
+        queued[cur.fetchone()[0]] = (email, code)
+
+    subject, html = module.build_code_email('000000')
+    cur.execute(f'''
+        INSERT INTO {schema}.email_outbox (to_email, subject, html, expires_at)
+        VALUES (%s, %s, %s, %s) RETURNING id
+    ''', (f'outbox-{uuid.uuid4()}@example.com', subject, html, datetime.utcnow() - timedelta(minutes=1)))
+    return queued, cur.fetchone()[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--fail-first', type=int, default=3, help='сколько первых писем SMTP отклонит с 451')
+    args = parser.parse_args()
+
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    handler = RecordingHandler(args.fail_first)
+    controller = Controller(handler, hostname='127.0.0.1', port=0)
+    controller.start()
+
+    os.environ.update({
+        'SMTP_HOST': controller.hostname,
+        'SMTP_PORT': str(controller.port),
+        'SMTP_STARTTLS': '0',
+        'SMTP_USER': 'outbox@example.com'
+    })
+    os.environ.pop('SMTP_PASSWORD', None)
+    module = load_handler_module()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    queued, expired_id = seed(cur, schema, module, args.messages)
+    conn.commit()
+    ids = list(queued) + [expired_id]
+
+    try:
+        runs = []
+        for _ in range(module.OUTBOX_MAX_ATTEMPTS):
+            runs.append(json.loads(module.deliver_outbox({})['body']))
+            # Отклонённые письма ждут задержки повтора — для проверки переносим их на сейчас
+            cur.execute(f'''
+                UPDATE {schema}.email_outbox SET next_attempt_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s) AND status = 'pending'
+            ''', (ids,))
+            conn.commit()
+            if not cur.rowcount:
+                break
+        module.close_smtp_session()
+
+        cur.execute(f'''
+            SELECT id, status, subject, html FROM {schema}.email_outbox WHERE id = ANY(%s)
+        ''', (ids,))
+        rows = {row[0]: row[1:] for row in cur.fetchall()}
+
+        delivered = {rcpt for rcpt_tos, _ in handler.received for rcpt in rcpt_tos}
+        problems = []
+        for message_id, (email, code) in queued.items():
+            status, subject, html = rows[message_id]
+            if status != 'sent':
+                problems.append(f'{message_id}: status {status}')
+            if subject or html:
+                problems.append(f'{message_id}: text kept after send')
+            if email not in delivered:
+                problems.append(f'{message_id}: not received by SMTP')
+            elif not any(code in content for rcpt_tos, content in handler.received if email in rcpt_tos):
+                problems.append(f'{message_id}: code missing from delivered message')
+
+        status, subject, html = rows[expired_id]
+        if status != 'expired' or subject or html:
+            problems.append(f'{expired_id}: expired row is {status} with text kept={bool(subject or html)}')
+        if len(handler.received) != len(queued):
+            problems.append(f'SMTP received {len(handler.received)} messages, expected {len(queued)}')
+
+        print(json.dumps({
+            'queued': len(queued),
+            'received': len(handler.received),
+            'rejected': handler.rejected,
+            'runs': runs,
+            'problems': problems
+        }, indent=2, ensure_ascii=False))
+    finally:
+        conn.rollback()
+        cur.execute(f'DELETE FROM {schema}.email_outbox WHERE id = ANY(%s)', (ids,))
+        conn.commit()
+        conn.close()
+        controller.stop()
+
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
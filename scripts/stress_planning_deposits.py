@@ -0,0 +1,182 @@
+'''Нагрузочная проверка атомарности пополнений целей: параллельные update_deposit / delete_deposit /
+пополнения через update_item против локальной Postgres, затем сверка saved_amount = SUM(amount).
+
+Запуск (схема с применёнными миграциями):
+    DATABASE_URL=postgresql://localhost/finance MAIN_DB_SCHEMA=t_p6400114_finance_tracker_mobi \
+        python scripts/stress_planning_deposits.py --workers 8 --ops 500
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import uuid
+from decimal import Decimal
+from multiprocessing import Pool
+
+import psycopg2
+import psycopg2.extensions
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'backend', 'fixed-planning', 'index.py')
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    '''Курсор, считающий выполненные операторы — по одному обращению к БД на execute'''
+    executed = 0
+
+    def execute(self, query, params=None):
+        CountingCursor.executed += 1
+        return super().execute(query, params)
+
+
+def load_handler_module():
+    '''Загружает index.py функции fixed-planning; соединения в нём открываются со считающим курсором'''
+    spec = importlib.util.spec_from_file_location('fixed_planning_index', INDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # Воркер пула может получить несколько заданий — подменяем connect один раз
+    if not getattr(psycopg2.connect, 'counting', False):
+        connect = psycopg2.connect
+
+        def counting_connect(dsn, **kwargs):
+            return connect(dsn, **{'cursor_factory': CountingCursor, **kwargs})
+
+        counting_connect.counting = True
+        psycopg2.connect = counting_connect
+    return module
+
+
+def seed(schema: str, goals: int, deposits_per_goal: int) -> tuple:
+    '''Создаёт пользователя и цели с историей пополнений; saved_amount изначально равен сумме'''
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'''
+        INSERT INTO {schema}.users (google_id, email, name)
+        VALUES (%s, %s, 'stress') RETURNING id
+    ''', (f'stress-{uuid.uuid4()}', f'stress-{uuid.uuid4()}@example.com'))
+    user_id = cur.fetchone()[0]
+
+    planning_ids = []
+    for index in range(goals):
+        cur.execute(f'''
+            INSERT INTO {schema}.planning (user_id, title, target_amount, category)
+            VALUES (%s, %s, 1000000, 'other') RETURNING id
+        ''', (user_id, f'stress goal {index}'))
+        planning_id = cur.fetchone()[0]
+        planning_ids.append(planning_id)
+
+        cur.execute(f'''
+            INSERT INTO {schema}.planning_deposits (planning_id, amount, comment)
+            SELECT %s, (random() * 1000)::numeric(10, 2), 'seed' FROM generate_series(1, %s)
+        ''', (planning_id, deposits_per_goal))
+        cur.execute(f'''
+            UPDATE {schema}.planning
+            SET saved_amount = (SELECT SUM(amount) FROM {schema}.planning_deposits WHERE planning_id = %s)
+            WHERE id = %s
+        ''', (planning_id, planning_id))
+
+    conn.commit()
+    conn.close()
+    return user_id, planning_ids
+
+
+def run_worker(args: tuple) -> dict:
+    '''Выполняет случайную смесь операций над общими целями и возвращает число операторов по видам'''
+    user_id, planning_ids, ops, seed_value = args
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    rng = random.Random(seed_value)
+    stats = {'update': [0, 0], 'delete': [0, 0], 'add': [0, 0], 'missed': 0}
+
+    # Служебное соединение открываем до подмены connect (или с обычным курсором), его запросы не считаются
+    conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=psycopg2.extensions.cursor)
+    conn.autocommit = True
+    lookup = conn.cursor()
+    module = load_handler_module()
+
+    for _ in range(ops):
+        planning_id = rng.choice(planning_ids)
+        lookup.execute(f'''
+            SELECT id FROM {schema}.planning_deposits WHERE planning_id = %s ORDER BY random() LIMIT 1
+        ''', (planning_id,))
+        row = lookup.fetchone()
+        action = rng.choice(['update', 'update', 'delete', 'add']) if row else 'add'
+        amount = Decimal(rng.randint(1, 100000)) / 100
+
+        before = CountingCursor.executed
+        if action == 'update':
+            response = module.update_deposit(user_id, row[0], planning_id, amount, 'stress')
+        elif action == 'delete':
+            response = module.delete_deposit(user_id, {'depositId': str(row[0]), 'id': str(planning_id)})
+        else:
+            response = module.update_item(user_id, {'type': 'planning', 'id': planning_id, 'addAmount': str(amount)})
+
+        # Соседний воркер мог удалить пополнение между выбором и операцией — это ожидаемо
+        if response['statusCode'] == 404:
+            stats['missed'] += 1
+        elif response['statusCode'] >= 400:
+            raise RuntimeError(f'{action} failed: {response["body"]}')
+
+        stats[action][0] += 1
+        stats[action][1] += CountingCursor.executed - before
+
+    conn.close()
+    return stats
+
+
+def check_drift(schema: str, planning_ids: list) -> list:
+    '''Цели, у которых saved_amount разошёлся с суммой пополнений'''
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT p.id, p.saved_amount, COALESCE(SUM(pd.amount), 0)
+        FROM {schema}.planning p
+        LEFT JOIN {schema}.planning_deposits pd ON pd.planning_id = p.id
+        WHERE p.id = ANY(%s)
+        GROUP BY p.id
+        HAVING p.saved_amount IS DISTINCT FROM COALESCE(SUM(pd.amount), 0)
+    ''', (planning_ids,))
+    drift = cur.fetchall()
+    conn.close()
+    return drift
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=500, help='операций на воркер')
+    parser.add_argument('--goals', type=int, default=3, help='мало целей — больше конфликтов')
+    parser.add_argument('--deposits', type=int, default=50, help='начальных пополнений на цель')
+    args = parser.parse_args()
+
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    user_id, planning_ids = seed(schema, args.goals, args.deposits)
+
+    with Pool(args.workers) as pool:
+        results = pool.map(run_worker, [(user_id, planning_ids, args.ops, seed_value) for seed_value in range(args.workers)])
+
+    totals = {'update': [0, 0], 'delete': [0, 0], 'add': [0, 0], 'missed': 0}
+    for stats in results:
+        totals['missed'] += stats['missed']
+        for action in ('update', 'delete', 'add'):
+            totals[action][0] += stats[action][0]
+            totals[action][1] += stats[action][1]
+
+    drift = check_drift(schema, planning_ids)
+    print(json.dumps({
+        'userId': user_id,
+        'operations': {action: totals[action][0] for action in ('update', 'delete', 'add')},
+        'notFound': totals['missed'],
+        'statementsPerOperation': {
+            action: round(totals[action][1] / totals[action][0], 2) if totals[action][0] else None
+            for action in ('update', 'delete', 'add')
+        },
+        'driftedGoals': [{'planningId': row[0], 'savedAmount': str(row[1]), 'depositTotal': str(row[2])} for row in drift]
+    }, indent=2, ensure_ascii=False))
+
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
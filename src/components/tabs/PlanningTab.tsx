@@ -10,6 +10,9 @@ import Icon from '@/components/ui/icon';
 import { Textarea } from '@/components/ui/textarea';
 import { api, PlanningGoal, PlanningDeposit, Transaction } from '@/lib/api';
 
+const DEPOSITS_PAGE_SIZE = 50;
+const MAX_GOALS_PER_REQUEST = 100;
+
 const EXPENSE_CATEGORIES = [
   { value: 'food', label: 'Продукты', color: '#0EA5E9' },
   { value: 'transport', label: 'Транспорт', color: '#F97316' },
@@ -26,11 +29,13 @@ const EXPENSE_CATEGORIES = [
 
 interface PlanningTabProps {
   expenses: Transaction[];
+  initialItems?: PlanningGoal[];
+  onItemsChange?: (items: PlanningGoal[]) => void;
 }
 
-const PlanningTab = ({ expenses }: PlanningTabProps) => {
-  const [items, setItems] = useState<PlanningGoal[]>([]);
-  const [loading, setLoading] = useState(true);
+const PlanningTab = ({ expenses, initialItems, onItemsChange }: PlanningTabProps) => {
+  const [items, setItems] = useState<PlanningGoal[]>(initialItems ?? []);
+  const [loading, setLoading] = useState(!initialItems);
   const [newItem, setNewItem] = useState({
     title: '',
     targetAmount: '',
@@ -41,15 +46,26 @@ const PlanningTab = ({ expenses }: PlanningTabProps) => {
   const [editingDeposit, setEditingDeposit] = useState<{ id: number; amount: string; comment: string } | null>(null);
   const [expandedGoal, setExpandedGoal] = useState<number | null>(null);
   const [deposits, setDeposits] = useState<{ [key: number]: PlanningDeposit[] }>({});
+  const [depositCursors, setDepositCursors] = useState<{ [key: number]: string | null }>({});
 
   useEffect(() => {
-    loadItems();
+    if (!initialItems) {
+      loadItems();
+    }
   }, []);
 
+  useEffect(() => {
+    const missing = items.map(item => item.id).filter(id => !deposits[id]);
+    if (missing.length > 0) {
+      loadDepositsForGoals(missing.slice(0, MAX_GOALS_PER_REQUEST));
+    }
+  }, [items]);
+
   const loadItems = async () => {
     try {
       const data = await api.planning.getAll();
       setItems(data);
+      onItemsChange?.(data);
     } catch (error) {
       console.error('Failed to load planning goals:', error);
     } finally {
@@ -59,8 +75,32 @@ const PlanningTab = ({ expenses }: PlanningTabProps) => {
 
   const loadDeposits = async (planningId: number) => {
     try {
-      const data = await api.planning.getDeposits(planningId);
-      setDeposits(prev => ({ ...prev, [planningId]: data }));
+      const page = await api.planning.getDepositsPage(planningId, DEPOSITS_PAGE_SIZE);
+      setDeposits(prev => ({ ...prev, [planningId]: page.deposits }));
+      setDepositCursors(prev => ({ ...prev, [planningId]: page.nextCursor }));
+    } catch (error) {
+      console.error('Failed to load deposits:', error);
+    }
+  };
+
+  const loadDepositsForGoals = async (planningIds: number[]) => {
+    try {
+      const data = await api.planning.getDepositsForGoals(planningIds, DEPOSITS_PAGE_SIZE);
+      setDeposits(prev => ({ ...prev, ...data.deposits }));
+      setDepositCursors(prev => ({ ...prev, ...data.nextCursors }));
+    } catch (error) {
+      console.error('Failed to load deposits:', error);
+    }
+  };
+
+  const loadMoreDeposits = async (planningId: number) => {
+    const cursor = depositCursors[planningId];
+    if (!cursor) return;
+
+    try {
+      const page = await api.planning.getDepositsPage(planningId, DEPOSITS_PAGE_SIZE, cursor);
+      setDeposits(prev => ({ ...prev, [planningId]: [...(prev[planningId] ?? []), ...page.deposits] }));
+      setDepositCursors(prev => ({ ...prev, [planningId]: page.nextCursor }));
     } catch (error) {
       console.error('Failed to load deposits:', error);
     }
@@ -123,9 +163,8 @@ const PlanningTab = ({ expenses }: PlanningTabProps) => {
       });
       setEditingAmount({ ...editingAmount, [id]: { amount: '', comment: '' } });
       await loadItems();
-      if (expandedGoal === id) {
-        await loadDeposits(id);
-      }
+      // История могла быть подгружена заранее и для свёрнутой цели — обновляем всегда
+      await loadDeposits(id);
     } catch (error) {
       console.error('Failed to add expense:', error);
     }
@@ -441,6 +480,16 @@ const PlanningTab = ({ expenses }: PlanningTabProps) => {
                               История трат пуста
                             </p>
                           )}
+                          {depositCursors[item.id] && (
+                            <Button
+                              size="sm"
+                              variant="ghost"
+                              onClick={() => loadMoreDeposits(item.id)}
+                              className="w-full text-xs"
+                            >
+                              Показать ещё
+                            </Button>
+                          )}
                         </div>
                       )}
 
@@ -17,6 +17,67 @@ export interface Transaction {
   category?: string;
 }
 
+export interface TransactionPage {
+  transactions: Transaction[];
+  nextCursor: string | null;
+}
+
+export interface MonthSummary {
+  year: number;
+  month: number;
+  totals: {
+    income: number;
+    expenses: number;
+    balance: number;
+    incomeCount: number;
+    expenseCount: number;
+  };
+  previous: {
+    year: number;
+    month: number;
+    income: number;
+    expenses: number;
+    balance: number;
+  };
+  deltas: {
+    income: number;
+    expenses: number;
+    balance: number;
+  };
+  byCategory: Array<{
+    category: string;
+    amount: number;
+    count: number;
+    previousAmount: number;
+    delta: number;
+  }>;
+  daily: Array<{
+    date: string;
+    expenses: number;
+    income: number;
+  }>;
+}
+
+export interface MonthTrend {
+  year: number;
+  month: number;
+  income: number;
+  expenses: number;
+  balance: number;
+}
+
+export interface ImportResult {
+  imported: number;
+  expenses: number;
+  incomes: number;
+  failed: number;
+  total: number;
+  errors: Array<{
+    row: number;
+    error: string;
+  }>;
+}
+
 export interface FixedExpense {
   id: number;
   title: string;
@@ -45,6 +106,54 @@ export interface PlanningDeposit {
   createdAt: string;
 }
 
+export interface GoalForecast {
+  planningId: number;
+  monthlyRate: number;
+  remaining: number;
+  projectedCompletion: string | null;
+  requiredMonthly: number | null;
+  onTrack: boolean | null;
+  isCompleted: boolean;
+}
+
+export interface DepositPage {
+  deposits: PlanningDeposit[];
+  nextCursor: string | null;
+  months?: Array<{ month: string; count: number; total: number }>;
+}
+
+export interface BootstrapData {
+  user: User;
+  expenses: Transaction[];
+  incomes: Transaction[];
+  fixedExpenses: FixedExpense[];
+  planning: PlanningGoal[];
+  summary: MonthSummary;
+}
+
+export interface SyncDelta {
+  fullResync: boolean;
+  watermark: string;
+  incomes?: Transaction[];
+  expenses?: Transaction[];
+  fixed?: FixedExpense[];
+  planning?: PlanningGoal[];
+  deposits?: Array<PlanningDeposit & { planningId: number }>;
+  deleted?: Record<'incomes' | 'expenses' | 'fixed' | 'planning' | 'deposits', number[]>;
+}
+
+export interface BatchOperation {
+  target: 'transactions' | 'fixed-planning';
+  method: 'POST' | 'PUT' | 'DELETE';
+  body?: Record<string, unknown>;
+  params?: Record<string, string | number>;
+}
+
+export interface BatchResult {
+  committed: boolean;
+  results: Array<{ index: number; status: number; error?: string; [key: string]: unknown }>;
+}
+
 export interface AutoExpenseResult {
   created: Array<{
     id: number;
@@ -66,6 +175,41 @@ export interface AutoExpenseResult {
 }
 
 export const api = {
+  bootstrap: async (token: string, year: number, month: number): Promise<BootstrapData | null> => {
+    try {
+      const response = await fetch(`${TRANSACTIONS_URL}?action=bootstrap&year=${year}&month=${month}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) return null;
+      
+      return await response.json();
+    } catch (error) {
+      console.error('Bootstrap failed:', error);
+      return null;
+    }
+  },
+  
+  sync: async (token: string, since?: string): Promise<SyncDelta | null> => {
+    try {
+      const query = since ? `&since=${encodeURIComponent(since)}` : '';
+      const response = await fetch(`${TRANSACTIONS_URL}?action=sync${query}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) return null;
+      
+      return await response.json();
+    } catch (error) {
+      console.error('Sync failed:', error);
+      return null;
+    }
+  },
+  
   auth: {
     sendCode: async (email: string): Promise<{ success: boolean; message?: string; error?: string; dev_code?: string }> => {
       try {
@@ -175,6 +319,57 @@ export const api = {
       return data.transactions;
     },
     
+    getPage: async (type: 'income' | 'expense', limit: number, cursor?: string | null): Promise<TransactionPage> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      let url = `${TRANSACTIONS_URL}?type=${type}&limit=${limit}`;
+      if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+      }
+      
+      const response = await fetch(url, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch transactions');
+      
+      return response.json();
+    },
+    
+    getSummary: async (year: number, month: number): Promise<MonthSummary> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const response = await fetch(`${TRANSACTIONS_URL}?action=summary&year=${year}&month=${month}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch summary');
+      
+      return response.json();
+    },
+    
+    getTrend: async (months: number = 12): Promise<MonthTrend[]> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const response = await fetch(`${TRANSACTIONS_URL}?action=trend&months=${months}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch trend');
+      
+      const data = await response.json();
+      return data.trend;
+    },
+    
     add: async (transaction: {
       type: 'income' | 'expense';
       amount: number;
@@ -200,6 +395,59 @@ export const api = {
       return data.transaction;
     },
     
+    import: async (rows: Array<{
+      type: 'income' | 'expense';
+      amount: number;
+      date: string;
+      description?: string;
+      category?: string;
+    }> | string, strict: boolean = false): Promise<ImportResult> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const isCsv = typeof rows === 'string';
+      const response = await fetch(`${TRANSACTIONS_URL}?action=import${strict ? '&strict=1' : ''}`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': isCsv ? 'text/csv' : 'application/json',
+          'Authorization': `Bearer ${token}`,
+        },
+        body: isCsv ? rows : JSON.stringify(rows),
+      });
+      
+      if (!response.ok && response.status !== 422) throw new Error('Failed to import transactions');
+      
+      return response.json();
+    },
+    
+    exportLedger: async (format: 'jsonl' | 'csv' = 'jsonl', resource: string = 'all'): Promise<Blob> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const chunks: string[] = [];
+      let cursor: string | null = null;
+      
+      do {
+        let url = `${TRANSACTIONS_URL}?action=export&format=${format}&resource=${resource}`;
+        if (cursor) {
+          url += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        
+        const response = await fetch(url, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+          },
+        });
+        
+        if (!response.ok) throw new Error('Failed to export data');
+        
+        chunks.push(await response.text());
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
+      
+      return new Blob(chunks, { type: format === 'csv' ? 'text/csv' : 'application/x-ndjson' });
+    },
+    
     delete: async (id: number, type: 'income' | 'expense'): Promise<void> => {
       const token = localStorage.getItem('auth_token');
       if (!token) throw new Error('Not authenticated');
@@ -213,6 +461,24 @@ export const api = {
       
       if (!response.ok) throw new Error('Failed to delete transaction');
     },
+    
+    batch: async (operations: BatchOperation[], atomic: boolean = false): Promise<BatchResult> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const response = await fetch(`${TRANSACTIONS_URL}?action=batch`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`,
+        },
+        body: JSON.stringify({ operations, atomic }),
+      });
+      
+      if (!response.ok && response.status !== 409) throw new Error('Failed to run batch');
+      
+      return response.json();
+    },
   },
   
   fixedExpenses: {
@@ -366,6 +632,63 @@ export const api = {
       return data.deposits;
     },
     
+    getForecasts: async (): Promise<GoalForecast[]> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const response = await fetch(`${FIXED_PLANNING_URL}?type=planning&action=forecast`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch forecasts');
+      
+      const data = await response.json();
+      return data.forecasts;
+    },
+    
+    getDepositsForGoals: async (planningIds: number[], limit: number): Promise<{
+      deposits: Record<number, PlanningDeposit[]>;
+      nextCursors: Record<number, string | null>;
+    }> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      const response = await fetch(`${FIXED_PLANNING_URL}?type=planning&ids=${planningIds.join(',')}&limit=${limit}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch deposits');
+      
+      return response.json();
+    },
+    
+    getDepositsPage: async (planningId: number, limit: number, cursor?: string | null, withMonths: boolean = false): Promise<DepositPage> => {
+      const token = localStorage.getItem('auth_token');
+      if (!token) throw new Error('Not authenticated');
+      
+      let url = `${FIXED_PLANNING_URL}?type=planning&id=${planningId}&limit=${limit}`;
+      if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+      }
+      if (withMonths) {
+        url += '&rollup=month';
+      }
+      
+      const response = await fetch(url, {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+      
+      if (!response.ok) throw new Error('Failed to fetch deposits');
+      
+      return response.json();
+    },
+    
     updateDeposit: async (planningId: number, depositId: number, amount: number, comment: string): Promise<void> => {
       const token = localStorage.getItem('auth_token');
       if (!token) throw new Error('Not authenticated');
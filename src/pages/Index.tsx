@@ -1,9 +1,9 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import Icon from '@/components/ui/icon';
 import LoginPage from '@/components/LoginPage';
-import { api, User, Transaction, FixedExpense } from '@/lib/api';
+import { api, User, Transaction, FixedExpense, PlanningGoal } from '@/lib/api';
 import OverviewTab from '@/components/tabs/OverviewTab';
 import ExpensesTab from '@/components/tabs/ExpensesTab';
 import IncomeTab from '@/components/tabs/IncomeTab';
@@ -38,6 +38,8 @@ const Index = () => {
   const [expenses, setExpenses] = useState<Transaction[]>([]);
   const [incomes, setIncomes] = useState<Transaction[]>([]);
   const [fixedExpenses, setFixedExpenses] = useState<FixedExpense[]>([]);
+  const [planningGoals, setPlanningGoals] = useState<PlanningGoal[] | undefined>(undefined);
+  const bootstrapped = useRef(false);
   
   const [newExpense, setNewExpense] = useState({ amount: '', category: 'food', description: '' });
   const [newIncome, setNewIncome] = useState({ amount: '', description: '' });
@@ -46,9 +48,14 @@ const Index = () => {
     const checkAuth = async () => {
       const savedToken = api.auth.getToken();
       if (savedToken) {
-        const userData = await api.auth.verifyToken(savedToken);
-        if (userData) {
-          setUser(userData);
+        const data = await api.bootstrap(savedToken, selectedDate.year, selectedDate.month);
+        if (data) {
+          bootstrapped.current = true;
+          setExpenses(data.expenses);
+          setIncomes(data.incomes);
+          setFixedExpenses(data.fixedExpenses.filter(f => f.isActive));
+          setPlanningGoals(data.planning);
+          setUser(data.user);
         } else {
           api.auth.logout();
         }
@@ -61,6 +68,10 @@ const Index = () => {
 
   useEffect(() => {
     if (user) {
+      if (bootstrapped.current) {
+        bootstrapped.current = false;
+        return;
+      }
       loadTransactions();
       loadFixedExpenses();
     }
@@ -317,7 +328,7 @@ const Index = () => {
           </TabsContent>
 
           <TabsContent value="planning">
-            <PlanningTab expenses={expenses} />
+            <PlanningTab expenses={expenses} initialItems={planningGoals} onItemsChange={setPlanningGoals} />
           </TabsContent>
 
           <TabsContent value="settings">